@@ -0,0 +1,208 @@
+"""
+Reads camera frames on a background thread, so the vision loop never has to
+wait for the USB camera.
+
+Calling `camera.read()` directly means every frame pays for the whole USB
+transfer and JPEG decoding before we can even start masking, and while we
+are busy with contours, the camera's own buffer fills up with old frames.
+Instead, wrap the camera once at the beginning of your program:
+
+    camera, width, height = util.get_video(channel)
+    camera = FrameGrabber(camera).start()
+
+The grabber keeps reading frames on its own thread (and its own core), and
+only remembers the newest one. It has the same `read()` method as a
+`cv2.VideoCapture`, so it can be given to `util.get_hsv` without changes.
+
+With several cameras (say, one on the front and one on the back of the
+robot), a `CameraGroup` reads them together. It first `grab`s a frame from
+every camera (which is quick), and only then `retrieve`s (decodes) them, so
+the frames are taken as close to the same moment as possible:
+
+    cameras = CameraGroup([front, rear])
+    timestamp, frames = cameras.read()
+"""
+
+import threading
+import time
+
+
+class FrameGrabber:
+    """
+    Continuously reads frames from a camera (anything with a `read()` method,
+    like `cv2.VideoCapture`), and keeps only the newest frame along with the
+    time it was captured.
+
+    Frames are written into a small _ring_ of slots. The capture thread never
+    writes into the slot holding the newest frame, or the slot that was last
+    handed to the vision loop, so a frame we are processing is never changed
+    underneath us (until we ask for the next one).
+    """
+
+    def __init__(self, camera, slots=3):
+        if slots < 3:
+            raise ValueError("FrameGrabber needs at least three slots")
+
+        self.camera = camera
+        self._slots = [None] * slots
+        self._stamps = [0.0] * slots
+        self._numbers = [0] * slots
+        self._newest = -1    # Slot holding the most recent frame
+        self._reading = -1   # Slot last handed to the vision loop
+        self._count = 0      # Number of frames captured so far
+        self._handed = 0     # Frame number last handed to the vision loop
+
+        self._lock = threading.Lock()
+        self._arrived = threading.Condition(self._lock)
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the capture thread. Returns itself, so this can be called
+        when creating the grabber.
+        """
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                                            name="frame-grabber", daemon=True)
+            self._thread.start()
+        return self
+
+    def _free_slot(self):
+        "Returns the index of a slot that nobody is looking at."
+        with self._lock:
+            for idx in range(len(self._slots)):
+                if idx != self._newest and idx != self._reading:
+                    return idx
+
+    def _run(self):
+        """
+        The capture thread: read a frame into a free slot, and then make that
+        slot the newest one. The frame it replaces is simply dropped.
+        """
+        while self._running:
+            idx = self._free_slot()
+            if self._slots[idx] is None:
+                # A frame source may hand us its own frame (not a copy), so
+                # the slot gets a copy we are free to read into later:
+                success, frame = self.camera.read()
+                if success:
+                    frame = frame.copy()
+            else:
+                # Re-use the slot's memory when the camera supports it:
+                success, frame = self.camera.read(self._slots[idx])
+
+            if not success:
+                # An unplugged (or finished) camera returns right away, so
+                # don't spin a whole core while we wait for it:
+                time.sleep(0.005)
+                continue
+
+            with self._lock:
+                self._count += 1
+                self._slots[idx] = frame
+                self._stamps[idx] = time.monotonic()
+                self._numbers[idx] = self._count
+                self._newest = idx
+                self._arrived.notify_all()
+
+    def latest(self):
+        """
+        Returns the newest frame, the `time.monotonic()` value when it was
+        captured, and its frame number (counting from 1), without waiting.
+        Before the first frame arrives, this returns `None, 0.0, 0`.
+        """
+        with self._lock:
+            return self._hand_out()
+
+    def _hand_out(self):
+        "Marks the newest slot as being read. Call with the lock held."
+        if self._newest < 0:
+            return None, 0.0, 0
+        self._reading = self._newest
+        self._handed = self._numbers[self._newest]
+        return (self._slots[self._newest], self._stamps[self._newest],
+                self._handed)
+
+    def read(self, image=None, timeout=1.0):
+        """
+        Works like `cv2.VideoCapture.read()`, returning a `success` flag and
+        the newest frame. If the vision loop is faster than the camera, this
+        waits (up to `timeout` seconds) for a frame we haven't seen yet,
+        instead of handing back the same frame twice.
+
+        Note: The frame returned is only valid until the next call to `read`.
+        The `image` parameter is accepted for compatibility, but ignored.
+        """
+        with self._lock:
+            self._arrived.wait_for(lambda: self._count > self._handed,
+                                   timeout)
+            if self._count <= self._handed:
+                return False, None
+            frame, _, _ = self._hand_out()
+            return True, frame
+
+    def get(self, prop):
+        "Returns a camera property, for instance `cv2.CAP_PROP_FRAME_WIDTH`."
+        return self.camera.get(prop)
+
+    def isOpened(self):
+        "Returns True if the camera is still open."
+        return self.camera.isOpened()
+
+    def release(self):
+        "Stops the capture thread, and releases the camera."
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.camera.release()
+
+
+class CameraGroup:
+    """
+    Reads several cameras (anything with `grab()` and `retrieve()` methods,
+    like `cv2.VideoCapture` or our frame sources) at the same moment.
+    """
+    def __init__(self, cameras):
+        self.cameras = list(cameras)
+
+    def __len__(self):
+        return len(self.cameras)
+
+    def read(self, wanted=None, images=None):
+        """
+        Grabs a frame from every camera, and returns the time they were
+        grabbed, and a dictionary of the frames, by the camera's position in
+        our list. Only cameras in `wanted` (if given) are decoded, the rest
+        of the grabbed frames are skipped. If given, `images` is a list with
+        an array (or None) for each camera to read its frame into.
+
+        Raises `EOFError` if any camera has closed.
+        """
+        grabbed = [camera.grab() for camera in self.cameras]
+        timestamp = time.monotonic()
+
+        frames = {}
+        for i, camera in enumerate(self.cameras):
+            if not grabbed[i]:
+                if not camera.isOpened():
+                    raise EOFError("No more frames to read from camera "
+                                   "{}".format(i))
+                continue
+            if wanted is None or i in wanted:
+                image = images[i] if images else None
+                success, frame = camera.retrieve(image)
+                if success:
+                    frames[i] = frame
+        return timestamp, frames
+
+    def get(self, prop):
+        "Returns a property of the first camera (see `FrameGrabber.get`)."
+        return self.cameras[0].get(prop)
+
+    def release(self):
+        "Releases every camera."
+        for camera in self.cameras:
+            camera.release()
@@ -25,6 +25,18 @@ def unpack_range(d):
     return lower, upper
 
 
+def unpack_ranges(colors, names=None):
+    """
+    Takes the `color` section of our configuration (a dictionary of named
+    ranges, each created by pack_range), and returns a dictionary of the
+    `lower` and `upper` numpy arrays for each color. If `names` is given,
+    only those colors are returned, in that order.
+    """
+    if names is None:
+        names = list(colors)
+    return {name: unpack_range(colors[name]) for name in names}
+
+
 def color_histogram(chan):
     """
     After splitting an image into three channels (paths) of an HSV, call this
@@ -33,10 +45,10 @@ def color_histogram(chan):
     in the image that match that value.
     """
     hist = cv2.calcHist([chan], [0], None, [256], [0, 256])
-    color_frequency = [p[0] for p in hist]
 
-    # The numpy array (np.array) allows us to use these two demensional array
-    return np.array(color_frequency)
+    # Older versions of OpenCV give us a 256x1 array (a column), and newer
+    # ones a flat array of 256 values, so we always flatten it:
+    return hist.ravel()
 
 
 def image_colors(image):
@@ -74,11 +86,12 @@ def color_range(image):
     return(lower, upper)  # returns lowest and highest most frequent values
 
 
-def get_mask(hsv_img, lower, upper):
+def get_mask(hsv_img, lower, upper, dst=None):
     """
     Given an image and color range, return a simplified masked image.
+    If given, the mask is written into `dst` instead of a new array.
     """
-    thresh = cv2.inRange(hsv_img, lower, upper)
+    thresh = cv2.inRange(hsv_img, lower, upper, dst=dst)
 
     # perform some clean up before contour operations
     # thresh = cv2.erode(thresh, None, iterations=2)
@@ -87,18 +100,330 @@ def get_mask(hsv_img, lower, upper):
     return thresh
 
 
+def build_lookup(lower, upper, bits=6):
+    """
+    Builds a table that answers "is this BGR color inside the HSV range?"
+    for every color, so we can skip converting each frame to HSV.
+
+    A table with every one of the 16 million BGR colors would be too big,
+    so we only keep the top `bits` of each channel (6 bits gives us 64
+    levels of each, and 262,144 colors). Each entry in the table is 255 if
+    the color (in the middle of its level) is inside the range, or 0.
+    """
+    levels = 1 << bits
+    step = 256 >> bits
+    middles = np.arange(levels) * step + step // 2
+
+    # Make an "image" containing every color in the table, in the same order
+    # as the `LookupMask` calculates its index, and convert it to HSV once:
+    b, g, r = np.meshgrid(middles, middles, middles, indexing='ij')
+    colors = np.dstack([b.ravel(), g.ravel(), r.ravel()]).astype(np.uint8)
+    hsv = cv2.cvtColor(colors, cv2.COLOR_BGR2HSV)
+
+    return cv2.inRange(hsv, lower, upper).ravel()
+
+
+class LookupMask:
+    """
+    An alternative to `get_mask` that works directly on a BGR image (it
+    doesn't need `util.get_hsv`), by looking up each pixel's color in a
+    table built by `build_lookup` for a `lower` and `upper` HSV range:
+
+        lookup = LookupMask(lower, upper)
+        mask = lookup.mask(cv2.GaussianBlur(img, (11, 11), 0))
+
+    The table is only built once, so create a new `LookupMask` only when
+    the color range changes. Since colors are grouped into levels, pixels
+    right at the edges of the range may differ from what `get_mask` gives.
+    """
+    def __init__(self, lower, upper, bits=6):
+        self.table = build_lookup(lower, upper, bits)
+
+        # For each channel value, this is what it adds to the table index,
+        # for instance, the blue channel's top bits are shifted the most:
+        levels = np.arange(256, dtype=np.int32) >> (8 - bits)
+        self.steps = np.dstack([levels << (2 * bits), levels << bits, levels])
+        self.weights = np.ones((1, 3))
+
+        # Per-pixel index parts, table index and mask, re-used for each
+        # frame. They only grow, so masking smaller windows of a frame (like
+        # the `TargetTracker` does) uses part of them, and creates nothing:
+        self._parts = np.empty(0, np.int32)
+        self._sums = np.empty(0, np.int32)
+        self._index = np.empty(0, np.intp)
+        self._values = np.empty(0, np.uint8)
+
+    def _scratch(self, shape):
+        "Returns our per-pixel images, for an image of `shape`."
+        pixels = shape[0] * shape[1]
+        if len(self._index) < pixels:
+            self._parts = np.empty(pixels * 3, np.int32)
+            self._sums = np.empty(pixels, np.int32)
+            self._index = np.empty(pixels, np.intp)
+            self._values = np.empty(pixels, np.uint8)
+        return (self._parts[:pixels * 3].reshape(shape),
+                self._sums[:pixels].reshape(shape[:2]),
+                self._index[:pixels].reshape(shape[:2]),
+                self._values[:pixels].reshape(shape[:2]))
+
+    def mask(self, img, dst=None):
+        """
+        Given a BGR image, return a masked image of the pixels inside our
+        color range. If given, the mask is written into `dst`.
+        """
+        parts, sums, index, values = self._scratch(img.shape)
+        if dst is None:
+            dst = np.empty(img.shape[:2], np.uint8)
+
+        # Look up the part of the index each channel adds, and add them up:
+        cv2.LUT(img, self.steps, dst=parts)
+        cv2.transform(parts, self.weights, dst=sums)
+
+        # numpy makes a temporary copy of the index unless it is the type
+        # it indexes with (`intp`), and of the mask unless it is one solid
+        # block of memory (a window of a bigger mask isn't). Every index is
+        # inside the table, so "clip" changes nothing, but skips another
+        # temporary copy:
+        np.copyto(index, sums)
+        if dst.flags.c_contiguous:
+            return np.take(self.table, index, out=dst, mode="clip")
+        np.take(self.table, index, out=values, mode="clip")
+        np.copyto(dst, values)
+        return dst
+
+
+class MultiMask:
+    """
+    Masks several colors with a single pass over an HSV image, instead of
+    calling `get_mask` (and looking at every pixel again) for each color.
+    Give it a dictionary of color names and their `lower` and `upper`
+    ranges (see `unpack_ranges`), up to eight colors:
+
+        multi = MultiMask({'yellow': (lower, upper), 'green': ...})
+        masks = multi.masks(hsv)
+        masks['yellow']
+
+    The trick is that a color range is a _box_: a pixel is inside the range
+    if its hue, saturation and value are each inside their own range. So for
+    each channel we build a table of all 256 values, where bit `i` is set if
+    the value is inside color `i`'s range for that channel. Looking up all
+    three channels and combining them with a bitwise _and_ gives us a
+    _labels_ image, where bit `i` is set for the pixels of color `i`.
+    """
+    def __init__(self, colors):
+        if len(colors) > 8:
+            raise ValueError("MultiMask handles up to eight colors")
+
+        self.names = list(colors)
+        self.tables = np.zeros((3, 256), np.uint8)
+        values = np.arange(256)
+        for bit, name in enumerate(self.names):
+            lower, upper = colors[name]
+            for chan in range(3):
+                inside = (values >= lower[chan]) & (values <= upper[chan])
+                self.tables[chan][inside] |= 1 << bit
+
+        # To pull a single color's mask out of the labels, another table
+        # turns labels with the color's bit set into 255:
+        self.color_tables = [np.where(values & (1 << bit), 255, 0)
+                             .astype(np.uint8) for bit in range(len(colors))]
+
+        self._channels = None  # H, S, and V, re-used for each frame
+        self._labels = None
+        self._masks = None
+
+    def _allocate(self, shape):
+        self._channels = [np.empty(shape, np.uint8) for _ in range(3)]
+        self._labels = np.empty(shape, np.uint8)
+        self._masks = {name: np.empty(shape, np.uint8) for name in self.names}
+
+    def labels(self, hsv_img):
+        """
+        Returns the _labels_ image, where bit `i` of each pixel is set if
+        the pixel is inside the range of our `i`th color.
+        """
+        if self._labels is None or self._labels.shape != hsv_img.shape[:2]:
+            self._allocate(hsv_img.shape[:2])
+
+        hue, sat, val = self._channels
+        labels = self._labels
+        cv2.split(hsv_img, self._channels)
+        cv2.LUT(hue, self.tables[0], dst=labels)
+        cv2.LUT(sat, self.tables[1], dst=sat)
+        cv2.bitwise_and(labels, sat, dst=labels)
+        cv2.LUT(val, self.tables[2], dst=val)
+        return cv2.bitwise_and(labels, val, dst=labels)
+
+    def mask(self, labels, name, dst=None):
+        "Returns the mask of a single color from the labels image."
+        table = self.color_tables[self.names.index(name)]
+        return cv2.LUT(labels, table, dst=dst)
+
+    def masks(self, hsv_img):
+        """
+        Returns a dictionary of masks (like `get_mask` would give) for each
+        color. Note: the masks are re-used for the next image.
+        """
+        return self.split_labels(self.labels(hsv_img))
+
+    def split_labels(self, labels):
+        """
+        Returns the dictionary of masks for a labels image we already have
+        (from `labels`), so we don't need to look at the HSV image again.
+        """
+        return {name: self.mask(labels, name, self._masks[name])
+                for name in self.names}
+
+
+# The channels of a BGR image, by name, for a `ChannelMask`. The brightness
+# isn't a channel we can extract, so it gets a number no channel has:
+GRAY = -1
+CHANNELS = {"blue": 0, "green": 1, "red": 2, "gray": GRAY}
+
+
+class ChannelMask:
+    """
+    With a ring light around the camera, and a short exposure, the reflective
+    tape on the field is the only bright thing in the frame. We don't need
+    to blur all three channels and convert to HSV to find it, just look for
+    pixels brighter than the `threshold` in a single `channel` of the BGR
+    frame ("blue", "green", "red", or "gray" for the brightness).
+
+    With a green light, bright white things (like lamps) are bright in the
+    red channel too, so we can also subtract another channel (`minus`), and
+    keep pixels that are much greener than they are red:
+
+        ChannelMask("green", minus="red", threshold=60)
+
+    A `blur` (the width of a small box blur, 0 for none) smooths out specks.
+
+    A grayscale frame (with no channels at all) can only be masked by its
+    "gray" brightness.
+    """
+    def __init__(self, channel="green", minus=None, threshold=128, blur=0):
+        for name in (channel, minus):
+            if name is not None and name not in CHANNELS:
+                raise ValueError("Unknown channel: {}".format(name))
+        self.channel = CHANNELS[channel]
+        self.minus = CHANNELS[minus] if minus is not None else None
+        self.threshold = threshold
+        self.blur = blur
+        self._values = None  # The channel we threshold, re-used each frame
+        self._other = None
+
+    def _extract(self, img, channel, dst):
+        if img.ndim == 2:
+            if channel != GRAY:
+                raise ValueError("A grayscale frame has no color channels")
+            np.copyto(dst, img)  # We change the values, but not the frame
+            return dst
+        if channel == GRAY:
+            return cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=dst)
+        return cv2.extractChannel(img, channel, dst=dst)
+
+    def mask(self, img, dst=None):
+        """
+        Returns a mask of the pixels of the BGR (or grayscale) `img` that are
+        brighter than our threshold. If given, the mask is written into `dst`.
+        """
+        if self._values is None or self._values.shape != img.shape[:2]:
+            self._values = np.empty(img.shape[:2], np.uint8)
+            self._other = np.empty_like(self._values)
+
+        values = self._extract(img, self.channel, self._values)
+        if self.minus is not None:
+            other = self._extract(img, self.minus, self._other)
+            cv2.subtract(values, other, dst=values)  # Stops at 0
+        if self.blur:
+            cv2.blur(values, (self.blur, self.blur), dst=values)
+        _, mask = cv2.threshold(values, self.threshold, 255,
+                                cv2.THRESH_BINARY, dst=dst)
+        return mask
+
+
+def mask_agreement(mask, expected):
+    """
+    Returns the fraction (from 0 to 1) of pixels in two masks that agree,
+    for instance, to compare a `LookupMask` with `get_mask`.
+    """
+    return np.count_nonzero(mask == expected) / mask.size
+
+
 def get_contours(img):
     """
     Contours are a curve joining all the continuous points along the
     boundary of the same color or intensity. The list of contours are
     sorted based on size from smallest to largest.
     """
-    # _ = image that is ignored
-    _, contours, hierarchy = cv2.findContours(img.copy(), cv2.RETR_EXTERNAL,
-                                              cv2.CHAIN_APPROX_SIMPLE)
+    # Since OpenCV 3.2, `findContours` no longer changes the image, so we
+    # don't need to copy it first. OpenCV 3 returns the image as well as the
+    # contours and hierarchy, but OpenCV 4 doesn't, so we take the contours
+    # counting from the end:
+    contours = cv2.findContours(img, cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)[-2]
     return sorted(contours, key=cv2.contourArea)
 
 
+def _largest(areas, count, min_area):
+    """
+    Returns the indexes of the `count` largest `areas` (that are at least
+    `min_area`), largest first. Like sorting them all and taking them from
+    the end, when areas are equal, the later one comes first.
+    """
+    keep = np.flatnonzero(areas >= min_area)
+    if count < len(keep):
+        # Partitioning finds the `count`th largest area without sorting
+        # everything. We keep every area at least that large (there may be
+        # more than `count` of them if some are equal):
+        cutoff = np.partition(areas[keep], len(keep) - count)[-count]
+        keep = keep[areas[keep] >= cutoff]
+    keep = keep[::-1]
+    return keep[np.argsort(-areas[keep], kind='stable')][:count]
+
+
+def largest_contours(img, count=1, min_area=0):
+    """
+    Like `get_contours`, but only returns the `count` largest contours,
+    largest first. Sorting every contour just to use the biggest one is a
+    lot of work on a noisy frame with hundreds of specks, so instead, we
+    calculate each contour's area once, throw away the ones smaller than
+    `min_area`, and only pick out the largest few. Returns the contours and
+    their areas.
+    """
+    contours = cv2.findContours(img, cv2.RETR_EXTERNAL,
+                                cv2.CHAIN_APPROX_SIMPLE)[-2]
+    if len(contours) == 0:
+        return [], np.empty(0)
+
+    areas = np.fromiter((cv2.contourArea(c) for c in contours), float,
+                        len(contours))
+    keep = _largest(areas, count, min_area)
+    return [contours[i] for i in keep], areas[keep]
+
+
+def largest_components(img, count=1, min_area=0, labels=None):
+    """
+    An alternative to `largest_contours` that finds the _connected
+    components_ (groups of touching pixels) in a mask. A single OpenCV call
+    gives us every component's bounding box, area (number of pixels), and
+    center, so nothing needs to be calculated one contour at a time.
+
+    Returns three arrays for the `count` largest components, largest first:
+    their bounding boxes (x, y, width, height), areas and centers (x, y).
+    The `labels` image, if given, is re-used to hold the component numbers.
+    """
+    _, labels, stats, centers = cv2.connectedComponentsWithStats(
+        img, labels=labels, connectivity=8, ltype=cv2.CV_32S)
+
+    # Component 0 is the background (everything not in the mask):
+    stats = stats[1:]
+    centers = centers[1:]
+    areas = stats[:, cv2.CC_STAT_AREA]
+
+    keep = _largest(areas, count, min_area)
+    return stats[keep, :4], areas[keep], centers[keep]
+
+
 # The smoothing feature was taken from this SciPy Cookbook chapter:
 # http://scipy-cookbook.readthedocs.io/items/SignalSmooth.html
 
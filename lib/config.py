@@ -45,14 +45,55 @@ Set a value where the parameters list a series of nested keys, as in:
     config.set('color', 'lower', [12, 43, 52])
 
 Notice the last parameter is the value to set!
+
+Saving writes the whole file, which can take a while on a robot's SD card.
+In _write-behind_ mode, `save` returns right away, and a background thread
+writes the file a moment later (several quick saves become a single write):
+
+    config.write_behind(delay=1.0)
+    config.set('fudges', 'center_x', 4)
+    config.save()      # Doesn't wait for the disk
+    ...
+    config.close()     # Writes anything that is left
+
+The file is written to a temporary file first, and then renamed, so a robot
+that loses power in the middle of a save still has the old file.
+
+While running, `reload_if_changed` quickly checks whether someone edited the
+file, and if so, reads it again and returns the names of the sections that
+changed. Values that take work to create from a section (like numpy arrays
+or lookup tables) can be made with `view`, which only calls its function
+again after that section changes:
+
+    def ranges(section):
+        return color_mask.unpack_ranges(section)
+
+    colors = config.view('color', ranges)
+    ...
+    if 'color' in config.reload_if_changed():
+        colors = config.view('color', ranges)
 """
 
+import atexit
+import copy
+import os
+import shutil
+import tempfile
+import threading
+import time
 import yaml
 from os.path import expanduser, exists
 from functools import reduce
 from operator import getitem
 
 
+# The permissions that new files don't get (see `os.umask`). The only way
+# to read the umask is to change it (and put it back), which would race
+# with any thread creating a file, so we read it once, as we're imported:
+_UMASK = os.umask(0o22)
+os.umask(_UMASK)
+
+
 class Config:
     # All configuration parameters are stored in this dictionary:
     params = {}
@@ -63,7 +104,24 @@ class Config:
         file containing the configuration values, or specifying those defaults
         as a dictionary.
         """
-        self.params = defaults
+        self.defaults = copy.deepcopy(defaults)
+        self.params = copy.deepcopy(defaults)
+
+        # Values we `set` that haven't been written to the file yet, so they
+        # aren't lost if the file is read again before we save:
+        self.unsaved = {}
+
+        # Used by the write-behind mode (see `write_behind`):
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.dirty = False
+        self.delay = None
+        self.writer = None
+
+        # The file's modification time when we last read (or wrote) it, and
+        # the values `view` has created, for each section:
+        self.mtime = None
+        self.views = {}
 
         # The _default_ configuration file name (if never specified) should be
         # in the HOME directory (since it is computer-specific). We use the
@@ -77,9 +135,9 @@ class Config:
     def load(self):
         """
         Read the YAML configuration file specified when this was instantiated.
-        Note: Specific configuration values from the file overwrite existing
-        values, but existing values are not automatically removed. For
-        instance, if the original params was:
+        Note: Values from the file overwrite the default values we were
+        created with, but the defaults the file doesn't mention are kept.
+        For instance, if the defaults were:
 
             { 'foo': 42,
               'bar': 71
@@ -96,20 +154,175 @@ class Config:
               'bar': 72,
               'baz': 11
             }
+
+        Reading the file again replaces all of the `params`, so a value
+        removed from the file is removed here too (unless it has a default).
+        Values we `set` but haven't saved yet are kept.
+
+        This returns the names of the top-level sections that changed
+        (including ones that were added or removed).
         """
+        changed = set()
         if exists(self.config_file):
+            mtime = os.stat(self.config_file).st_mtime_ns
             with open(self.config_file) as infile:
-                ps = yaml.load(infile)
-                if ps is not None:
-                    self.params.update(ps)
+                ps = yaml.safe_load(infile)
+            with self.lock:
+                self.mtime = mtime
+                params = copy.deepcopy(self.defaults)
+                params.update(ps or {})
+                for keys, value in self.unsaved.items():
+                    self._setter(params, keys, value)
+
+                missing = object()
+                changed = {key for key in set(self.params) | set(params)
+                           if self.params.get(key, missing) !=
+                           params.get(key, missing)}
+                self.params = params
+                # Anything made from a changed section has to be made again:
+                for key in list(self.views):
+                    if key[0] in changed:
+                        del self.views[key]
+        return changed
+
+    def reload_if_changed(self):
+        """
+        Reads the configuration file again, but only if it was changed since
+        we last read (or wrote) it. Checking takes only a few microseconds,
+        so this can be called often. Returns the names of the top-level
+        sections that changed (an empty set if nothing did).
+        """
+        try:
+            mtime = os.stat(self.config_file).st_mtime_ns
+        except OSError:
+            return set()
+        if mtime == self.mtime:
+            return set()
+        try:
+            return self.load()
+        except yaml.YAMLError as e:
+            # Maybe we read it while someone is still editing. We will try
+            # again once they have saved it again:
+            print("ERROR: Can't reload {0}: {1}".format(self.config_file, e))
+            self.mtime = mtime
+            return set()
+
+    def view(self, section, build):
+        """
+        Returns `build(config.get(section))`, but only calls `build` the
+        first time, and again after the `section` changes in a reload. Give
+        the same function each time, as the values are remembered for each
+        section and function.
+        """
+        key = (section, build)
+        with self.lock:
+            if key not in self.views:
+                self.views[key] = build(self.get(section))
+            return self.views[key]
 
     def save(self):
         """
         Creates a YAML configuration file based on the values of the `params`
-        dictionary.
+        dictionary. In write-behind mode, this only asks the background
+        thread to write the file, and doesn't wait for it.
+        """
+        with self.lock:
+            if self.writer:
+                self.dirty = True
+                self.changed.notify()
+                return
+        self._write()
+
+    def _write(self):
+        """
+        Writes the `params` to a temporary file next to our configuration
+        file, and then renames it, replacing the old file in one step.
+        """
+        # Turn the parameters into text while holding the lock (so `set`
+        # can't change them half-way), but write to the disk without it:
+        with self.lock:
+            self.dirty = False
+            text = yaml.safe_dump(self.params, default_flow_style=None)
+            saving = dict(self.unsaved)
+
+        folder = os.path.dirname(os.path.abspath(self.config_file))
+        fd, temp = tempfile.mkstemp(suffix='.yaml', dir=folder)
+        try:
+            with os.fdopen(fd, 'w') as outfile:
+                outfile.write(text)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            # The temporary file can only be read by us, so give it the
+            # permissions of the file it replaces (or a new file's):
+            if exists(self.config_file):
+                shutil.copymode(self.config_file, temp)
+            else:
+                os.chmod(temp, 0o666 & ~_UMASK)
+            os.replace(temp, self.config_file)
+            # Our own save shouldn't look like someone edited the file:
+            self.mtime = os.stat(self.config_file).st_mtime_ns
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+        # The values we just wrote are in the file now (unless they were
+        # set again while we were writing):
+        with self.lock:
+            for keys, value in saving.items():
+                if self.unsaved.get(keys) is value:
+                    del self.unsaved[keys]
+
+    def write_behind(self, delay=1.0):
+        """
+        Starts saving from a background thread. After a `save`, the thread
+        waits `delay` seconds (so more changes can join it), and then writes
+        the file once. The file is also written when Python exits, or when
+        we call `close`.
         """
-        with open(self.config_file, 'w') as outfile:
-            yaml.dump(self.params, outfile)
+        with self.lock:
+            if self.writer is None:
+                self.delay = delay
+                self.writer = threading.Thread(target=self._run, daemon=True)
+                self.writer.start()
+                atexit.register(self.close)
+        return self
+
+    def _run(self):
+        "The background thread that writes the file after a `save`."
+        while True:
+            with self.lock:
+                while not self.dirty and self.writer:
+                    self.changed.wait()
+                if not self.writer:
+                    return
+                # Wait a moment, in case more changes come along (a `save`
+                # wakes us up, so we keep waiting until the time is up):
+                deadline = time.monotonic() + self.delay
+                remaining = self.delay
+                while self.writer and remaining > 0:
+                    self.changed.wait(remaining)
+                    remaining = deadline - time.monotonic()
+            try:
+                self._write()
+            except Exception as e:
+                print("ERROR: Can't save {0}: {1}".format(self.config_file, e))
+
+    def flush(self):
+        "Writes the file now, if there are changes that haven't been saved."
+        with self.lock:
+            dirty = self.dirty
+        if dirty:
+            self._write()
+
+    def close(self):
+        "Stops the write-behind thread, and writes any unsaved changes."
+        with self.lock:
+            writer, self.writer = self.writer, None
+            self.changed.notify()
+        if writer:
+            writer.join()
+            atexit.unregister(self.close)
+        self.flush()
 
     def get(self, *kvs):
         """
@@ -194,7 +407,11 @@ class Config:
 
         # The _real work_ is done in this helper function that just
         # needs to get a good start with initial parameters:
-        return self._setter(self.params, keys, value)
+        with self.lock:
+            # (Moved to the end, so they are set again in the same order)
+            self.unsaved.pop(keys, None)
+            self.unsaved[keys] = value
+            return self._setter(self.params, keys, value)
 
     def _setter(self, dc, keys, value):
         """
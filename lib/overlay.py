@@ -0,0 +1,84 @@
+"""
+Drawing on our images (circles around targets, bounding boxes, and so on) is
+wonderful when we are watching what the vision code sees, but on the robot,
+nobody is watching, and every pixel we draw is wasted time.
+
+An `Overlay` records what we would like to draw, and only draws it when we
+ask it to `render`, so the tracking code can describe its drawings without
+caring whether anyone will look at them:
+
+    overlay = Overlay(every=3)
+    while True:
+        overlay.next_frame()
+        target = target_tracker.single_target(mask, overlay=overlay)
+        if overlay.active:
+            cv2.imshow("image", overlay.render(img))
+
+With `every=3`, only every third frame is recorded and drawn. Code that
+doesn't have a viewer simply doesn't create an overlay, and draws nothing.
+"""
+
+import cv2
+
+
+class Overlay:
+    """
+    Records drawing commands (see the `circle`, `rectangle` and `contours`
+    methods) for the current frame, and draws them all with `render`.
+    """
+    def __init__(self, every=1):
+        self.every = every
+        self.frame = 0
+        self.commands = []
+
+        # Targets found in a window of a frame are drawn relative to the
+        # window's corner, so we move everything by this (x, y) amount:
+        self.origin = (0, 0)
+
+    @property
+    def active(self):
+        "True if drawings for this frame are recorded (every Nth frame)."
+        return self.frame % self.every == 0
+
+    def next_frame(self):
+        "Starts a new frame, forgetting any drawings that weren't rendered."
+        self.frame += 1
+        self.commands.clear()
+        self.origin = (0, 0)
+
+    def _move(self, point):
+        return (int(point[0]) + self.origin[0], int(point[1]) + self.origin[1])
+
+    def circle(self, center, radius, color, thickness=1):
+        "Records a circle, as `cv2.circle` would draw it."
+        if self.active:
+            self.commands.append((cv2.circle, (self._move(center),
+                                               int(radius), color,
+                                               thickness)))
+
+    def rectangle(self, corner, opposite, color, thickness=1):
+        "Records a rectangle, as `cv2.rectangle` would draw it."
+        if self.active:
+            self.commands.append((cv2.rectangle, (self._move(corner),
+                                                  self._move(opposite),
+                                                  color, thickness)))
+
+    def contours(self, contours, color, thickness=1):
+        "Records outlines of all the contours, like `cv2.drawContours`."
+        if self.active:
+            moved = [c + self.origin for c in contours]
+            self.commands.append((cv2.drawContours, (moved, -1, color,
+                                                     thickness)))
+
+    def render(self, img):
+        """
+        Draws everything recorded for this frame on `img`, and returns it.
+        An image we can't draw on (like a frame replayed from an archive) is
+        copied first, and the copy is returned.
+        """
+        if not img.flags.writeable:
+            img = img.copy()
+        for draw, args in self.commands:
+            draw(img, *args)
+        self.commands.clear()
+        return img
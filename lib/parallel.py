@@ -0,0 +1,239 @@
+"""
+Looks for targets in several frames at the same time, one on each of our
+computer's cores, instead of one frame after another.
+
+Sending a whole frame from one process to another is slow (it gets copied,
+twice), so frames are kept in a _ring_ of slots in shared memory, which all
+the processes can see. Only the slot's number is sent to a worker:
+
+    capture thread            worker processes              main loop
+    --------------            ----------------              ---------
+    read camera into  --->    mask and find the    --->     put results
+    a free slot               target in the slot            back in order
+
+The camera is read by a thread in our own process (so it can be any camera
+or frame source we have already opened), and the results are put back in
+the order the frames were captured, even if a later frame finishes first:
+
+    frames = ParallelPipeline(camera, lower, upper, workers=3).start()
+    for number, target in frames.results():
+        ...
+    frames.stop()
+"""
+
+import multiprocessing
+import queue
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+from . import target_tracker, util
+from .pipeline import Pipeline
+
+
+class SharedRing:
+    """
+    A number of `slots`, each holding a frame of `shape`, in a block of
+    shared memory. Create it with no `name`, and other processes can then
+    open the same memory using its `name`.
+    """
+    def __init__(self, slots, shape, name=None):
+        size = slots * int(np.prod(shape))
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.frames = np.ndarray((slots,) + tuple(shape), np.uint8,
+                                 buffer=self.memory.buf)
+
+    def close(self):
+        "Stops using the memory (in this process)."
+        self.frames = None
+        self.memory.close()
+
+    def unlink(self):
+        "Frees the memory, once every process has closed it."
+        self.memory.unlink()
+
+
+def _worker(name, slots, shape, settings, tasks, results):
+    """
+    The loop each worker process runs: take a slot number, find the target
+    in that slot's frame, and send back the target. A `None` task means
+    there are no more frames.
+    """
+    ring = SharedRing(slots, shape, name)
+    pipeline = Pipeline(settings["lower"], settings["upper"],
+                        settings["goal"], settings["interpolation"],
+                        settings["engine"], channel=settings["channel"])
+    pipeline.allocate(shape[1], shape[0])
+    finder = settings["finder"]
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        number, slot = task
+        mask = pipeline.mask(ring.frames[slot])
+        target = finder(mask, [], settings["min_area"])
+        results.put((number, slot,
+                     target_tracker.scale_target(target, pipeline.scale)))
+    ring.close()
+
+
+class ParallelPipeline:
+    """
+    Reads frames from the `camera` and finds the target (between the colors
+    `lower` and `upper`) in each of them, with `workers` processes. The
+    other settings are the same as a `Pipeline`'s, and the `finder` is one
+    of the `target_tracker.FINDERS`.
+
+    There are `slots` frames in the ring (two for each worker, if not
+    given). When all of them are waiting for a worker, the camera isn't
+    read until one is free. If the camera doesn't know its frame size, the
+    ring is made for the size of the first frame, when we `start`. If
+    reading a frame fails (other than running out of frames), `results`
+    raises a `RuntimeError` after the frames before it.
+    """
+    def __init__(self, camera, lower, upper, workers=3, slots=None,
+                 goal=util.FRAME_WIDTH_GOAL, interpolation=util.INTERPOLATION[
+                     "area"], engine="hsv", channel=None, min_area=0,
+                 finder=target_tracker.single_target, context=None):
+        width, height = util.frame_size(camera)
+        self.camera = camera
+        self.workers = workers
+        self.shape = (int(height), int(width), 3) if width else None
+        self.slots = slots or 2 * workers
+        self.settings = {"lower": lower, "upper": upper, "goal": goal,
+                         "interpolation": interpolation, "engine": engine,
+                         "channel": channel,
+                         "min_area": min_area, "finder": finder}
+
+        # Each worker starts a new Python (rather than a copy of this one,
+        # which may have threads running that a copy wouldn't have):
+        self.context = context or multiprocessing.get_context("spawn")
+        self.ring = None
+        self.processes = []
+        self.free = queue.Queue()
+        self.tasks = self.context.Queue()
+        self.done = self.context.Queue()
+        self.captured = None    # The number of frames, once we run out
+        self.error = None       # Why we stopped capturing, if it failed
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        "Starts the workers and the capture thread, and returns this."
+        first = None
+        if self.shape is None:
+            first = util.read_frame(self.camera)
+            self.shape = first.shape
+        self.ring = SharedRing(self.slots, self.shape)
+        for slot in range(self.slots):
+            self.free.put(slot)
+        for _ in range(self.workers):
+            process = self.context.Process(
+                target=_worker, daemon=True,
+                args=(self.ring.name, self.slots, self.shape, self.settings,
+                      self.tasks, self.done))
+            process.start()
+            self.processes.append(process)
+
+        self.running = True
+        self.thread = threading.Thread(target=self._capture, args=(first,),
+                                       name="parallel-capture", daemon=True)
+        self.thread.start()
+        return self
+
+    def _capture(self, first=None):
+        """
+        Reads each frame into a free slot (starting with the `first` frame,
+        if we already read it), and gives it to a worker.
+        """
+        number = 0
+        try:
+            while self.running:
+                slot = self.free.get()
+                if slot is None:
+                    break
+                frame = self.ring.frames[slot]
+                if first is not None:
+                    img, first = first, None
+                else:
+                    img = util.read_frame(self.camera, frame)
+                # Many cameras (like a `FrameGrabber`) ignore the image we
+                # give them, and hand us their own frame, so we copy it:
+                if img is not frame:
+                    np.copyto(frame, img)
+                self.tasks.put((number, slot))
+                number += 1
+        except EOFError:
+            pass
+        except Exception as e:
+            self.error = e      # For `results` to raise
+        finally:
+            self.captured = number
+            for _ in self.processes:
+                self.tasks.put(None)
+
+    def results(self):
+        """
+        Yields the frame number and target (or None) of every frame, in the
+        order they were captured, until we run out of frames (or `stop`).
+        """
+        waiting = {}    # Results that came in before an earlier frame's
+        expected = 0
+        while self.captured is None or expected < self.captured:
+            if expected in waiting:
+                yield expected, waiting.pop(expected)
+                expected += 1
+                continue
+            try:
+                number, slot, target = self.done.get(timeout=0.1)
+            except queue.Empty:
+                if not self.running:
+                    return
+                self._check_workers()
+                continue
+            self.free.put(slot)
+            waiting[number] = target
+        self._check_capture()
+
+    def _check_workers(self):
+        """
+        Raises a `RuntimeError` (after stopping everything) if a worker has
+        crashed, since the frames it was given will never come back.
+        """
+        for process in self.processes:
+            if process.exitcode not in (None, 0):
+                code = process.exitcode
+                self.stop()
+                raise RuntimeError("A worker process stopped with exit "
+                                   "code {}".format(code))
+
+    def _check_capture(self):
+        """
+        Raises a `RuntimeError` (after stopping everything) if reading a
+        frame failed, so it doesn't look like we simply ran out of frames.
+        """
+        if self.error is not None:
+            error = self.error
+            self.stop()
+            message = "Can't capture frames: {}".format(error)
+            raise RuntimeError(message) from error
+
+    def stop(self):
+        "Stops reading frames, and the workers, and frees the shared memory."
+        self.running = False
+        self.free.put(None)     # In case the capture thread is waiting
+        if self.thread:
+            self.thread.join()
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        if self.ring:
+            self.ring.close()
+            self.ring.unlink()
+            self.ring = None
@@ -0,0 +1,282 @@
+"""
+The steps that turn a camera frame into a mask of our target's color:
+
+    read -> shrink -> blur -> HSV -> mask
+
+Calling `util.get_hsv` and `color_mask.get_mask` creates new images for
+every step of every frame. At 30 to 60 frames a second, that is a lot of
+memory to hand back and forth, and Python's garbage collector (as well as
+the operating system) can pause our loop while it cleans up. A `Pipeline`
+creates all these images once, and then re-uses them for every frame:
+
+    pipeline = Pipeline(lower, upper)
+    while True:
+        mask = pipeline.mask(pipeline.read(camera))
+        target = target_tracker.single_target(mask)
+
+The `engine` chooses how pixels are matched to the color range. The `hsv`
+engine converts each frame to HSV and calls `color_mask.get_mask`, while the
+`lookup` engine uses a `color_mask.LookupMask` table to skip converting to
+HSV altogether. For retroreflective tape lit by a ring light, the `channel`
+engine ignores the color range, and only looks for pixels that are bright
+in one channel (see `color_mask.ChannelMask`, which is made from the
+`channel` dictionary of settings), the cheapest of them all.
+
+To track several colors at once, give a dictionary of `colors` (see
+`color_mask.unpack_ranges`) and call `masks` instead of `mask`, to get
+every color's mask from a single pass over the HSV image (this needs the
+`hsv` engine).
+
+On a computer with several cores, `stripes` splits each frame into that
+many horizontal stripes, and blurs, converts and masks them at the same time
+on a pool of threads (OpenCV lets other threads run while it works). This
+makes each frame take less time, not just lets us look at more frames.
+
+Give a `timing.StageTimer` as the `timer` to measure how long the shrink,
+HSV (which includes blurring) and mask stages take.
+
+The color ranges can be changed while running (for instance, after the
+configuration file is reloaded) with `set_ranges`. Call it between frames,
+and the next frame uses the new ranges.
+
+Note: Since the images are re-used, the mask (and the other images) are
+only valid until the next frame is processed. Copy them if you need them
+for longer.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from . import util, color_mask, timing
+
+
+class Buffers:
+    """
+    The images a pipeline needs for a single frame, created for a camera
+    of a particular `width` and `height`, shrunk to the `goal` width.
+    """
+    def __init__(self, width, height, goal=util.FRAME_WIDTH_GOAL):
+        width, height = int(width), int(height)
+        small_width, small_height = util.shrunk_size(width, height, goal)
+
+        self.frame = np.empty((height, width, 3), np.uint8)
+        self.small = np.empty((small_height, small_width, 3), np.uint8)
+        self.blurred = np.empty_like(self.small)
+        self.hsv = np.empty_like(self.small)
+        self.mask = np.empty((small_height, small_width), np.uint8)
+
+    def fits(self, img):
+        "Returns True if these buffers were created for images like `img`."
+        return img.shape == self.frame.shape
+
+
+class Stripes:
+    """
+    Blurs, converts to HSV, and masks an image in `count` horizontal stripes,
+    each on its own thread, writing into a single HSV image and mask.
+
+    Blurring a pixel looks at the rows around it, so each stripe blurs a few
+    extra rows (the `overlap`) above and below it, and then only keeps its
+    own rows. That way, the mask is exactly the same as masking the whole
+    image at once.
+    """
+    def __init__(self, count, overlap=util.BLUR_SIZE // 2):
+        self.count = count
+        self.overlap = overlap
+        self.pool = ThreadPoolExecutor(max_workers=count,
+                                       thread_name_prefix="stripe")
+        self._blurred = [None] * count  # Each stripe blurs into its own image
+
+    def _rows(self, height):
+        "Returns the first and last (plus one) row of each stripe."
+        edges = np.linspace(0, height, self.count + 1).astype(int)
+        return list(zip(edges[:-1], edges[1:]))
+
+    def _stripe(self, i, img, top, bottom, hsv, mask, lower, upper):
+        start = max(0, top - self.overlap)
+        stop = min(img.shape[0], bottom + self.overlap)
+        blurred = self._blurred[i]
+        if blurred is None or blurred.shape[0] < stop - start or \
+                blurred.shape[1:] != img.shape[1:]:
+            blurred = self._blurred[i] = np.empty(
+                (bottom - top + 2 * self.overlap,) + img.shape[1:], np.uint8)
+        blurred = util.blur(img[start:stop], blurred[:stop - start])
+
+        # Only our own rows (not the extra ones) are converted and masked:
+        ours = blurred[top - start:bottom - start]
+        cv2.cvtColor(ours, cv2.COLOR_BGR2HSV, dst=hsv[top:bottom])
+        color_mask.get_mask(hsv[top:bottom], lower, upper, mask[top:bottom])
+
+    def mask(self, img, hsv, mask, lower, upper):
+        """
+        Blurs, converts and masks the `img` into the `hsv` image and the
+        `mask`, and returns the mask.
+        """
+        jobs = [self.pool.submit(self._stripe, i, img, top, bottom, hsv,
+                                 mask, lower, upper)
+                for i, (top, bottom) in enumerate(self._rows(img.shape[0]))]
+        for job in jobs:
+            job.result()    # Waits for the stripe (and raises its errors)
+        return mask
+
+
+# The ways a pipeline can match pixels to a color range:
+ENGINES = ("hsv", "lookup", "channel")
+
+
+class Pipeline:
+    """
+    Converts frames into masks of the color between `lower` and `upper`,
+    re-using the same images for every frame.
+    """
+    def __init__(self, lower, upper, goal=util.FRAME_WIDTH_GOAL,
+                 interpolation=cv2.INTER_AREA, engine="hsv", bits=6,
+                 colors=None, timer=timing.OFF, stripes=0, channel=None):
+        if engine not in ENGINES:
+            raise ValueError("Unknown pipeline engine: {}".format(engine))
+        if stripes > 1 and engine != "hsv":
+            raise ValueError("Only the hsv engine can use stripes")
+        if colors and engine != "hsv":
+            raise ValueError("Only the hsv engine can track several colors")
+
+        self.engine = engine
+        self.bits = bits
+        self.goal = goal
+        self.interpolation = interpolation
+        self.timer = timer
+        self.stripes = Stripes(stripes) if stripes > 1 else None
+        self.channel = None
+        if engine == "channel":
+            self.channel = color_mask.ChannelMask(**(channel or {}))
+        self.buffers = None
+        self.scale = 1  # The full frame's width divided by the shrunk width
+        self.set_ranges(lower, upper, colors)
+
+    def set_ranges(self, lower, upper, colors=None):
+        """
+        Changes the color range (and the `colors`, if we track several).
+        Building the lookup tables takes a moment, so we only do it here,
+        and not for every frame. Everything is built before any of it is
+        swapped in, so a frame never sees half old and half new ranges.
+        """
+        lookup = None
+        if self.engine == "lookup":
+            lookup = color_mask.LookupMask(lower, upper, self.bits)
+
+        multi = None
+        if colors:
+            multi = color_mask.MultiMask(colors)
+
+        self.lower, self.upper = lower, upper
+        self.lookup, self.multi = lookup, multi
+
+    def allocate(self, width, height):
+        """
+        Creates the images for frames of the given size. Call this once at
+        startup (see `util.get_video`), otherwise, it is called when the
+        first frame arrives, or if a frame's size changes.
+        """
+        self.buffers = Buffers(width, height, self.goal)
+        self.scale = width / self.buffers.small.shape[1]
+        return self.buffers
+
+    def _buffers_for(self, img):
+        "Returns our buffers, making sure they fit the `img`."
+        if self.buffers is None or not self.buffers.fits(img):
+            height, width = img.shape[:2]
+            self.allocate(width, height)
+        return self.buffers
+
+    def read(self, camera):
+        """
+        Reads the next frame from the camera. When the camera allows it, the
+        frame is read into our own frame buffer. Frames replayed from an
+        archive are used where they are, without copying them (we never
+        change the frame, we only shrink it into our own images).
+        """
+        image = self.buffers.frame if self.buffers else None
+        return util.read_frame(camera, image)
+
+    def shrink(self, img):
+        "Shrinks a frame to our `goal` width."
+        bufs = self._buffers_for(img)
+        started = self.timer.start()
+        small = util.shrink(img, self.goal, self.interpolation, bufs.small)
+        self.timer.stage("shrink", started)
+        return small
+
+    def hsv(self, img):
+        "Shrinks, blurs and converts a frame to HSV."
+        small = self.shrink(img)
+        started = self.timer.start()
+        hsv = util.to_hsv(small, self.buffers.blurred, self.buffers.hsv)
+        self.timer.stage("hsv", started)
+        return hsv
+
+    def mask(self, img):
+        "Converts a frame into a mask of pixels that match our color range."
+        return self.mask_window(self.shrink(img))
+
+    def mask_window(self, small, x=0, y=0, width=None, height=None):
+        """
+        Masks only part of a frame that has already been shrunk, the window
+        starting at (x, y) that is `width` by `height` pixels. Without a
+        window, the whole frame is masked. Only the window's part of the
+        mask is returned.
+
+        Blurring a pixel looks at the pixels around it, so (like `Stripes`)
+        we blur a few extra pixels around the window, and the mask is
+        exactly the same as that part of the whole frame's mask.
+        """
+        bufs = self.buffers
+        frame_height, frame_width = small.shape[:2]
+        if width is None:
+            x, y, width, height = 0, 0, frame_width, frame_height
+        pad = util.BLUR_SIZE // 2
+        left, top = max(0, x - pad), max(0, y - pad)
+        right = min(frame_width, x + width + pad)
+        bottom = min(frame_height, y + height + pad)
+        padded = np.s_[top:bottom, left:right]
+        window = np.s_[y:y+height, x:x+width]
+        inside = np.s_[y-top:y-top+height, x-left:x-left+width]
+        timer = self.timer
+
+        if self.channel:
+            # The channel mask does its own (optional) blurring:
+            t = timer.start()
+            mask = self.channel.mask(small[padded], bufs.mask[padded])
+            timer.stage("mask", t)
+            return mask[inside]
+
+        t = timer.start()
+        if self.stripes:
+            mask = self.stripes.mask(small[padded], bufs.hsv[padded],
+                                     bufs.mask[padded], self.lower,
+                                     self.upper)
+            timer.stage("stripes", t)
+            return mask[inside]
+
+        blurred = util.blur(small[padded], bufs.blurred[padded])[inside]
+        if self.lookup:
+            t = timer.stage("blur", t)
+            mask = self.lookup.mask(blurred, bufs.mask[window])
+            timer.stage("mask", t)
+            return mask
+
+        hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV, dst=bufs.hsv[window])
+        t = timer.stage("hsv", t)
+        mask = color_mask.get_mask(hsv, self.lower, self.upper,
+                                   bufs.mask[window])
+        timer.stage("mask", t)
+        return mask
+
+    def masks(self, img):
+        """
+        Converts a frame into a dictionary of masks, one for each of our
+        `colors`, with a single pass over the HSV image.
+        """
+        hsv = self.hsv(img)
+        started = self.timer.start()
+        masks = self.multi.masks(hsv)
+        self.timer.stage("mask", started)
+        return masks
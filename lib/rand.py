@@ -1,6 +1,6 @@
 import numpy as np
 import math
-import matplotlib.pyplot as plt
+import cv2
 
 
 def plot(ary, label="Frequency", marks=[]):
@@ -10,6 +10,10 @@ def plot(ary, label="Frequency", marks=[]):
     The marks is an array of `y` values that will be highlighted with a
     vertical bar.
     """
+    # Only imported here, as nothing else in this file needs matplotlib
+    # (and the robot doesn't have it installed):
+    import matplotlib.pyplot as plt
+
     plt.plot(ary)
     plt.ylabel(label)
     if len(marks) > 0:
@@ -142,3 +146,143 @@ def random_bumpy_peak(size=1000):
     """
     x = np.linspace(0, 4, size)  # Generates a straight line of data points
     return .2*np.sin(10*x) + np.exp(-abs(2-x)**2)
+
+
+# Random numbers are also handy for making up whole camera frames. We can't
+# bring the robot (and the field) everywhere, and even when we do, we never
+# know _exactly_ where the target was in a photo. If we draw the targets
+# ourselves, we know exactly where they are, so we can check how close our
+# vision code gets, and make as many frames as we want.
+#
+# A frame is a _scene_ that has:
+#
+#   * A dull background, lit more on one side than the other (a lighting
+#     gradient), like a gym with windows on one wall
+#   * Some _distractors_, shapes of other colors that aren't our target
+#   * The targets: either cubes (squares, a little turned) or tape strips
+#     (long and thin)
+#   * Camera noise, and a bit of blur, since no lens is perfectly sharp
+#
+# Colors are in HSV, as that is how we describe them in our configuration:
+
+TARGET_COLORS = {"yellow": (30, 230, 220),
+                 "green": (80, 255, 255)}
+
+# The width and height of each kind of target, as a fraction of the frame's
+# width:
+TARGET_SHAPES = {"cube": (0.12, 0.12),
+                 "tape": (0.04, 0.2)}
+
+
+def hsv_to_bgr(hsv):
+    "Converts a single HSV color to the BGR color that OpenCV draws with."
+    pixel = np.uint8([[hsv]])
+    return tuple(int(c) for c in cv2.cvtColor(pixel, cv2.COLOR_HSV2BGR)[0, 0])
+
+
+def _overlaps(box, boxes, gap):
+    "Returns True if the (x, y, width, height) box is near any of the boxes."
+    x, y, w, h = box
+    return any(x < bx + bw + gap and bx < x + w + gap and
+               y < by + bh + gap and by < y + h + gap
+               for bx, by, bw, bh in boxes)
+
+
+def _place(rng, width, height, size, angle, boxes, tries=100):
+    """
+    Finds a spot for a rotated rectangle of `size` that is inside the frame,
+    and doesn't touch any of the `boxes` already placed. Returns the corners
+    of the rectangle and its bounding box, or None if we can't find a spot.
+    """
+    for _ in range(tries):
+        center = (rng.uniform(0, width), rng.uniform(0, height))
+        corners = cv2.boxPoints((center, size, angle))
+        box = cv2.boundingRect(np.round(corners).astype(np.int32))
+        x, y, w, h = box
+        inside = x >= 2 and y >= 2 and x + w <= width - 2 and \
+            y + h <= height - 2
+        if inside and not _overlaps(box, boxes, gap=8):
+            boxes.append(box)
+            return corners, box
+    return None
+
+
+def scene(width=640, height=480, targets=1, kind="cube", color="yellow",
+          distractors=4, noise=6.0, blur=1, gradient=0.25, seed=None):
+    """
+    Makes up a camera frame (a BGR image `width` by `height` pixels) with
+    `targets` targets of the given `kind` ("cube" or "tape") and `color`
+    (see TARGET_COLORS), as well as `distractors` shapes of other colors.
+
+    The `noise` is how much (the standard deviation) random camera noise
+    to add, `blur` is the radius of a Gaussian blur (0 is sharp), and the
+    `gradient` is how much brighter one side of the frame is than the
+    middle (0.25 is 25%). The same `seed` always gives the same frame.
+
+    Returns the frame, and a list of the _ground truth_ of each target, a
+    dictionary with the target's exact `center` (x, y), `size` (width and
+    height, before turning it by `angle` degrees), `area` in pixels, and
+    the `box` (x, y, width, height) it fits in.
+    """
+    rng = np.random.default_rng(seed)
+    hue = TARGET_COLORS[color][0]
+
+    # A dull (not very saturated) background color:
+    background = (int(rng.integers(0, 180)), int(rng.integers(0, 60)),
+                  int(rng.integers(60, 140)))
+    frame = np.empty((height, width, 3), np.uint8)
+    frame[:, :] = hsv_to_bgr(background)
+
+    boxes = []
+    for _ in range(distractors):
+        # Any hue at least 30 away from our target's (hues wrap at 180):
+        other = (hue + int(rng.integers(30, 150))) % 180
+        shape = (rng.uniform(0.03, 0.15) * width,
+                 rng.uniform(0.03, 0.15) * width)
+        spot = _place(rng, width, height, shape, rng.uniform(0, 90), boxes)
+        if spot:
+            bgr = hsv_to_bgr((other, int(rng.integers(100, 256)),
+                              int(rng.integers(100, 256))))
+            cv2.fillPoly(frame, [np.round(spot[0]).astype(np.int32)], bgr)
+
+    truth = []
+    target_width, target_height = TARGET_SHAPES[kind]
+    target_bgr = hsv_to_bgr(TARGET_COLORS[color])
+    for _ in range(targets):
+        scale = rng.uniform(0.8, 1.25)
+        size = (target_width * width * scale, target_height * width * scale)
+        angle = rng.uniform(-15, 15)
+        spot = _place(rng, width, height, size, angle, boxes)
+        if spot is None:
+            continue
+        corners, box = spot
+
+        # Measure the polygon exactly as it is drawn, so the ground truth
+        # matches the pixels in the frame:
+        polygon = np.round(corners).astype(np.int32)
+        cv2.fillPoly(frame, [polygon], target_bgr)
+        drawn = np.zeros((height, width), np.uint8)
+        cv2.fillPoly(drawn, [polygon], 1)
+        m = cv2.moments(drawn, binaryImage=True)
+        truth.append({"kind": kind, "color": color,
+                      "center": (m["m10"] / m["m00"], m["m01"] / m["m00"]),
+                      "size": size, "angle": angle, "area": m["m00"],
+                      "box": box})
+
+    # Light one side of the frame more than the other:
+    if gradient:
+        direction = rng.uniform(0, 2 * math.pi)
+        xs = np.linspace(-1, 1, width, dtype=np.float32) * math.cos(direction)
+        ys = np.linspace(-1, 1, height, dtype=np.float32) * math.sin(direction)
+        light = 1 + gradient * (xs[np.newaxis, :] + ys[:, np.newaxis]) / 2
+        frame = cv2.multiply(frame, cv2.merge([light, light, light]),
+                             dtype=cv2.CV_8U)
+
+    if blur:
+        frame = cv2.GaussianBlur(frame, (2 * blur + 1, 2 * blur + 1), 0)
+
+    if noise:
+        grain = rng.normal(0, noise, frame.shape).astype(np.float32)
+        frame = cv2.add(frame, grain, dtype=cv2.CV_8U)
+
+    return frame, truth
@@ -0,0 +1,170 @@
+"""
+Records the frames from a camera, so we can replay a match (with the real
+field's lighting) later, at full speed, on any computer.
+
+Compressing each frame (into a video, or JPEG files) takes time we don't
+have during a match, so a `Recorder` copies each frame, as is, into a big
+array on the disk that is _memory-mapped_ (the operating system writes it
+to the disk for us, in the background). An archive is a directory with:
+
+    frames.npy    All the frames, one after the other (a numpy array file)
+    index.npy     For each frame, when it was captured and its frame number
+    archive.json  How many frames were recorded, and their size
+
+Recording a camera looks like:
+
+    recorder = Recorder("match-12", width, height, capacity=3000)
+    camera = RecordingSource(camera, recorder)
+    ...               # Read from `camera` as usual
+    recorder.close()
+
+And to replay it, use an `ArchiveSource` (see `lib/sources.py`), or the
+`archive` source type in the configuration:
+
+    source:
+      type: archive
+      path: match-12
+
+The archive's frames are read straight from the memory-mapped file, so the
+frames given to us are never copied (or decoded).
+"""
+
+import json
+import os
+import time
+import numpy as np
+
+# What we store for every frame in the index:
+INDEX_FIELDS = np.dtype([("time", np.float64), ("number", np.int64)])
+
+
+class Recorder:
+    """
+    Copies up to `capacity` frames of `width` by `height` into an archive
+    in the `path` directory. The whole archive is created up front, so
+    recording never needs to ask for more disk space.
+
+    Every `save_every` frames, we update the number of frames recorded in
+    `archive.json`, so if the robot loses power, we still have most of it.
+
+    Some cameras don't know their size until they give us a frame, so with
+    no `width` (or `height`), the archive is created for the size of the
+    first frame we record.
+    """
+    def __init__(self, path, width=None, height=None, capacity=1000,
+                 save_every=30):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.count = 0
+        self.capacity = capacity
+        self.save_every = save_every
+        self.frames = None
+        self.index = None
+        self._warned = False   # Have we complained about a frame's size?
+        if width and height:
+            self._create(int(width), int(height))
+
+    def _create(self, width, height):
+        "Creates the archive files for frames of the given size."
+        self.frames = np.lib.format.open_memmap(
+            os.path.join(self.path, "frames.npy"), mode="w+", dtype=np.uint8,
+            shape=(self.capacity, height, width, 3))
+        self.index = np.lib.format.open_memmap(
+            os.path.join(self.path, "index.npy"), mode="w+",
+            dtype=INDEX_FIELDS, shape=(self.capacity,))
+        self._write_info()
+
+    @property
+    def full(self):
+        "True once we have recorded as many frames as we have room for."
+        return self.count >= self.capacity
+
+    def record(self, frame, timestamp=None, number=None):
+        """
+        Adds a frame to the archive, along with when it was captured (from
+        `time.monotonic`, if not given) and its frame `number`. Returns
+        False (and doesn't record it) if the archive is full, or the frame
+        isn't the size of the archive's frames (which we print, once).
+        """
+        if self.full:
+            return False
+        if self.frames is None:
+            self._create(frame.shape[1], frame.shape[0])
+        if frame.shape != self.frames.shape[1:]:
+            if not self._warned:
+                print("ERROR: Not recording frames of shape {}, the archive "
+                      "holds {}".format(frame.shape, self.frames.shape[1:]))
+                self._warned = True
+            return False
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if number is None:
+            number = self.count
+        self.frames[self.count] = frame
+        self.index[self.count] = (timestamp, number)
+        self.count += 1
+        if self.count % self.save_every == 0:
+            self._write_info()
+        return True
+
+    def _write_info(self):
+        _, height, width, _ = self.frames.shape
+        info = {"count": self.count, "width": width, "height": height,
+                "capacity": len(self.frames)}
+        with open(os.path.join(self.path, "archive.json"), "w") as outfile:
+            json.dump(info, outfile)
+
+    def flush(self):
+        "Makes sure everything recorded so far is written to the disk."
+        if self.frames is not None:
+            self.frames.flush()
+            self.index.flush()
+            self._write_info()
+
+    def close(self):
+        "Writes everything, and stops recording."
+        self.flush()
+        if self.frames is not None:
+            self.frames = self.frames[:self.count]
+
+
+class RecordingSource:
+    """
+    Wraps a camera (or any frame source), recording each frame we read from
+    it with the `recorder`. Once the recorder is full, frames are still
+    read, just no longer recorded.
+    """
+    def __init__(self, camera, recorder):
+        self.camera = camera
+        self.recorder = recorder
+        self.position = 0   # Number of frames read so far
+
+    def read(self, image=None):
+        success, frame = self.camera.read(image)
+        if success:
+            self.recorder.record(frame, time.monotonic(), self.position)
+            self.position += 1
+        return success, frame
+
+    def isOpened(self):
+        return self.camera.isOpened()
+
+    def get(self, prop):
+        return self.camera.get(prop)
+
+    def release(self):
+        self.camera.release()
+        self.recorder.close()
+
+
+def load(path):
+    """
+    Opens the archive in the `path` directory without reading it into
+    memory. Returns the frames (as a read-only, memory-mapped array) and
+    the index, with only the frames that were recorded.
+    """
+    with open(os.path.join(path, "archive.json")) as infile:
+        count = json.load(infile)["count"]
+    frames = np.load(os.path.join(path, "frames.npy"), mmap_mode="r")
+    index = np.load(os.path.join(path, "index.npy"), mmap_mode="r")
+    return frames[:count], index[:count]
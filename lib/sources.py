@@ -0,0 +1,336 @@
+"""
+Frame sources are the places our vision code gets its images from. Besides
+a live USB camera, we can replay images, video files, or frames we already
+have in memory, so we can run (and time) the whole vision pipeline on a
+computer without a camera attached.
+
+Every source works like a `cv2.VideoCapture`:
+
+    source = ImageSource("support/samples/*.jpg", loop=True)
+    success, frame = source.read()
+
+So they can be given to any function that expects a camera, like
+`util.get_hsv`. Like a camera, `read()` is the same as `grab()` (take the
+next frame) followed by `retrieve()` (decode it and hand it over), which
+lets us skip decoding frames we don't want. Sources that run out of frames
+(and aren't looping) return `False` from both `read()` and `isOpened()`.
+
+The `source` section in the configuration file chooses the source, for
+instance:
+
+    source:
+      type: images
+      path: support/samples/*.jpg
+      loop: true
+
+The `type` can be `camera` (with a `channel`, and optionally `settings`,
+like the frame size, see `util.configure_camera`), `images` (with a glob
+`path`), `video` (with a `path` to a video file), `array` (with a
+`path` to a `.npy` file of frames that is loaded into memory), or `archive`
+(with a `path` to a directory recorded by `lib/recorder.py`).
+"""
+
+import glob
+import cv2
+import numpy as np
+from . import recorder, util
+
+
+class FrameSource:
+    """
+    The base class for all frame sources. A source only needs to implement
+    `_next_frame()` (returning a frame, or None when out of frames), and
+    `_size()`, but may override anything else.
+    """
+    def __init__(self, loop=False):
+        self.loop = loop
+        self.position = 0     # Number of frames read so far
+        self.finished = False
+        self._grabbed = None  # The frame taken by `grab`
+
+    def _next_frame(self):
+        raise NotImplementedError()
+
+    def _decode(self, frame):
+        "Turns what `_next_frame` returned into an image (if it isn't one)."
+        return frame
+
+    def _size(self):
+        "Returns the width and height of the frames, as a tuple."
+        raise NotImplementedError()
+
+    def _count(self):
+        "Returns the number of frames available, or 0 if unknown."
+        return 0
+
+    def grab(self):
+        "Takes the next frame, without decoding it. Returns False if none."
+        if self.finished:
+            return False
+
+        frame = self._next_frame()
+        if frame is None:
+            self.finished = True
+            self._grabbed = None
+            return False
+
+        self.position += 1
+        self._grabbed = frame
+        return True
+
+    def retrieve(self, image=None):
+        """
+        Returns a `success` flag and the frame taken by `grab`. If `image` is
+        an array of the same shape as the frame, the frame is copied into it.
+        """
+        if self._grabbed is None:
+            return False, None
+        frame = self._decode(self._grabbed)
+        if frame is None:
+            # An image file that can't be read ends the source, as if we
+            # had run out of frames:
+            self.finished = True
+            self._grabbed = None
+            return False, None
+        if image is not None and image.shape == frame.shape:
+            np.copyto(image, frame)
+            return True, image
+        return True, frame
+
+    def read(self, image=None):
+        """
+        Returns a `success` flag and the next frame. If `image` is an array of
+        the same shape as the frame, the frame is copied into it.
+        """
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def __iter__(self):
+        "Loop over all frames, as in: `for frame in source:`"
+        while True:
+            success, frame = self.read()
+            if not success:
+                return
+            yield frame
+
+    def isOpened(self):
+        "Returns False after a source (that doesn't loop) runs out of frames."
+        return not self.finished
+
+    def get(self, prop):
+        """
+        Returns a few of the properties a `cv2.VideoCapture` has. Like the
+        camera, unknown properties return 0.
+        """
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self._size()[0])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self._size()[1])
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self._count())
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        return 0.0
+
+    def release(self):
+        "Closes the source. Reading afterwards returns no frames."
+        self.finished = True
+
+
+class CameraSource(FrameSource):
+    """
+    A live camera on a USB `channel` (or anything else `cv2.VideoCapture`
+    can open). A camera never runs out of frames, but a read may fail.
+
+    The `settings` (see `util.configure_camera`) are given to the camera as
+    soon as it is open, and `self.settings` has what the camera accepted.
+    """
+    def __init__(self, channel=0, settings=None):
+        super().__init__()
+        self.capture = cv2.VideoCapture(channel)
+        self.settings = {}
+        if settings:
+            self.settings = util.configure_camera(self.capture, settings)
+
+    def read(self, image=None):
+        success, frame = self.capture.read(image)
+        if success:
+            self.position += 1
+        return success, frame
+
+    def grab(self):
+        success = self.capture.grab()
+        if success:
+            self.position += 1
+        return success
+
+    def retrieve(self, image=None):
+        return self.capture.retrieve(image)
+
+    def isOpened(self):
+        return self.capture.isOpened()
+
+    def get(self, prop):
+        return self.capture.get(prop)
+
+    def release(self):
+        self.capture.release()
+
+
+class VideoSource(CameraSource):
+    """
+    Replays a video file (like the ones recorded with `cv2.VideoWriter`),
+    starting over at the beginning if `loop` is set.
+    """
+    def __init__(self, filename, loop=False):
+        super().__init__(filename)
+        self.loop = loop
+
+    def read(self, image=None):
+        if self.finished:
+            return False, None
+
+        success, frame = self.capture.read(image)
+        if not success and self.loop and self.position > 0:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success, frame = self.capture.read(image)
+
+        if success:
+            self.position += 1
+        else:
+            self.finished = True
+        return success, frame
+
+    def grab(self):
+        if self.finished:
+            return False
+
+        success = self.capture.grab()
+        if not success and self.loop and self.position > 0:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            success = self.capture.grab()
+
+        if success:
+            self.position += 1
+        else:
+            self.finished = True
+        return success
+
+    def isOpened(self):
+        return not self.finished and self.capture.isOpened()
+
+
+class ArraySource(FrameSource):
+    """
+    Hands out frames we already have in memory, either a list of images, or
+    a single array with a frame in each row (as `np.load` would give us).
+    This is the fastest source, as nothing is decoded or copied.
+
+    Note: The frames returned are the arrays given, so don't draw on them.
+    """
+    def __init__(self, frames, loop=False):
+        super().__init__(loop)
+        if len(frames) < 1:
+            raise ValueError("ArraySource needs at least one frame")
+        self.frames = frames
+
+    def _next_frame(self):
+        idx = self.position
+        if self.loop:
+            idx = idx % len(self.frames)
+        elif idx >= len(self.frames):
+            return None
+        return self.frames[idx]
+
+    def _size(self):
+        height, width = self.frames[0].shape[:2]
+        return width, height
+
+    def _count(self):
+        return len(self.frames)
+
+
+class ImageSource(ArraySource):
+    """
+    Reads image files matching a glob `pattern`, e.g. `samples/*.jpg`, in
+    alphabetical order. Images are decoded as they are read, unless
+    `preload` is set, in which case, they are all decoded up front (useful
+    when we want to time our code and not `cv2.imread`).
+    """
+    def __init__(self, pattern, loop=False, preload=False):
+        filenames = sorted(glob.glob(pattern))
+        if preload:
+            filenames = [cv2.imread(f) for f in filenames]
+        super().__init__(filenames, loop)
+        self.preload = preload
+
+    def _decode(self, frame):
+        # Until now, the frame is just the image's filename:
+        if self.preload:
+            return frame
+        return cv2.imread(frame)
+
+    def _size(self):
+        first = self.frames[0]
+        if not self.preload:
+            first = cv2.imread(first)
+        height, width = first.shape[:2]
+        return width, height
+
+
+class ArchiveSource(ArraySource):
+    """
+    Replays frames recorded by a `recorder.Recorder`. The frames are read
+    straight from the memory-mapped archive file, without copying them, so
+    this is almost as fast as an `ArraySource`, but doesn't need the
+    memory to hold every frame. The `timestamps` are when each frame was
+    captured (in seconds, from `time.monotonic`).
+
+    Note: The frames are read-only, so nothing can draw on them. Copy a
+    frame first (an `Overlay` does this for us).
+    """
+    def __init__(self, path, loop=False):
+        frames, self.index = recorder.load(path)
+        super().__init__(frames, loop)
+        self.timestamps = self.index["time"]
+
+    def retrieve(self, image=None):
+        """
+        Returns a `success` flag and the frame taken by `grab`, as a view of
+        the archive file. The `image` is ignored, since copying the frame
+        into it is what we are trying to avoid.
+        """
+        return super().retrieve()
+
+
+def open_source(spec, channel=0):
+    """
+    Creates a frame source from a dictionary, like the `source` section of
+    the configuration file. Without a `type`, this opens the camera on the
+    given `channel`.
+    """
+    kind = spec.get("type", "camera")
+    loop = spec.get("loop", False)
+
+    if kind == "camera":
+        return CameraSource(spec.get("channel", channel),
+                            spec.get("settings"))
+    if kind == "images":
+        return ImageSource(spec["path"], loop, spec.get("preload", False))
+    if kind == "video":
+        return VideoSource(spec["path"], loop)
+    if kind == "array":
+        return ArraySource(np.load(spec["path"]), loop)
+    if kind == "archive":
+        return ArchiveSource(spec["path"], loop)
+
+    raise ValueError("Unknown frame source type: {}".format(kind))
+
+
+def from_config(cfg, channel=0):
+    """
+    Creates the frame source described in the `source` section of our
+    configuration, or the camera on `channel` if that section is missing.
+    """
+    return open_source(cfg.get_default("source", {}), channel)
@@ -1,10 +1,38 @@
-"An interface to the NetworkTables service"
-from networktables import NetworkTables
+"""
+An interface to the NetworkTables service.
+
+Everything here talks to a _backend_. Normally, that is NetworkTables itself
+(the `NetworkTablesBackend`), but a `MemoryBackend` keeps every value in
+memory instead, so we can run (and test, and time) the vision code on a
+computer without a robot or a network:
+
+    backend = tables.MemoryBackend()
+    tables.setup("anywhere", backend=backend)
+    ...
+    for when, key, value in backend.puts:
+        print(when, key, value)
+
+To see how many values a second we can publish, and how long it takes
+from capturing a frame to publishing its target, run
+`support/publish_benchmark.py`.
+"""
+import collections
+import threading
 import time
 
+__backend = None
 __table = None
 __verbose = False
 
+# Once we `watch_fudges`, this holds the latest fudge values. Rather than
+# changing it, each update replaces it with a new dictionary, so readers
+# never need a lock:
+__fudges = None
+
+# Set while we are connected to the NetworkTables server (see `setup`):
+__connected = threading.Event()
+__on_connection = None
+
 
 def _print(message):
     """
@@ -14,29 +42,210 @@ def _print(message):
         print(message)
 
 
-def setup(server, name='vision', printtoo=False):
+class NetworkTablesBackend:
+    """
+    Sends everything to a real NetworkTables server, using `pynetworktables`
+    (which is only imported when we create this backend).
+    """
+    def __init__(self):
+        from networktables import NetworkTables
+        self.nt = NetworkTables
+
+    def initialize(self, server):
+        self.nt.initialize(server=server)
+
+    def getTable(self, name):
+        return self.nt.getTable(name)
+
+    def addConnectionListener(self, listener, immediateNotify=False):
+        self.nt.addConnectionListener(listener,
+                                      immediateNotify=immediateNotify)
+
+    def flush(self):
+        self.nt.flush()
+
+
+# What a `MemoryBackend` gives a connection listener (NetworkTables gives
+# a `ConnectionInfo` with more fields, but we only look at this one):
+MemoryConnection = collections.namedtuple("MemoryConnection", "remote_ip")
+
+
+class MemoryBackend:
+    """
+    Pretends to be a NetworkTables server, keeping every value in memory.
+    Each put is also recorded in `puts`, as a tuple of when it happened
+    (from `time.perf_counter`), the full key (like "/vision/center_x"), and
+    the value. It starts connected, but `disconnect` and `connect` let us
+    see what happens when the network comes and goes.
+    """
+    def __init__(self, connected=True):
+        self.server = None
+        self.values = {}
+        self.puts = []
+        self.flushes = 0
+        self.connected = connected
+        self._connection_listeners = []
+        self._entry_listeners = []   # (path, listener, localNotify) tuples
+        self._lock = threading.RLock()
+
+    def initialize(self, server):
+        self.server = server
+
+    def getTable(self, name):
+        return MemoryTable(self, "/" + name.strip("/"))
+
+    def addConnectionListener(self, listener, immediateNotify=False):
+        self._connection_listeners.append(listener)
+        if immediateNotify and self.connected:
+            listener(True, MemoryConnection(self.server))
+
+    def connect(self):
+        "Pretends the server has connected."
+        self.connected = True
+        for listener in self._connection_listeners:
+            listener(True, MemoryConnection(self.server))
+
+    def disconnect(self):
+        "Pretends the server has gone away."
+        self.connected = False
+        for listener in self._connection_listeners:
+            listener(False, MemoryConnection(self.server))
+
+    def flush(self):
+        self.flushes += 1
+
+    def put(self, path, value, local=True):
+        """
+        Stores and records a value, and tells any entry listeners. Use
+        `local=False` to pretend the value came from another computer (like
+        a driver changing a fudge on the dashboard).
+        """
+        with self._lock:
+            self.values[path] = value
+            self.puts.append((time.perf_counter(), path, value))
+            listeners = list(self._entry_listeners)
+        folder, _, key = path.rpartition("/")
+        for table_path, listener, localNotify in listeners:
+            if table_path == folder and (localNotify or not local):
+                listener(MemoryTable(self, folder), key, value, True)
+        return True
+
+    def history(self, path):
+        """
+        Returns when (from `time.perf_counter`) each value was put at the
+        full key `path`, as a list of (time, value) tuples. For instance,
+        publishing each frame's number lets us see how long after the frame
+        was captured it was sent (see `support/publish_benchmark.py`).
+        """
+        with self._lock:
+            return [(when, value) for when, key, value in self.puts
+                    if key == path]
+
+    def keys(self, folder):
+        "Returns the keys (and values) directly inside a table's folder."
+        with self._lock:
+            return [(path.rpartition("/")[2], value)
+                    for path, value in self.values.items()
+                    if path.rpartition("/")[0] == folder]
+
+    def listen(self, folder, listener, immediateNotify, localNotify):
+        with self._lock:
+            self._entry_listeners.append((folder, listener, localNotify))
+            existing = self.keys(folder)
+        if immediateNotify:
+            for key, value in existing:
+                listener(MemoryTable(self, folder), key, value, True)
+
+
+class MemoryTable:
+    """
+    The part of the NetworkTables table interface we use, for a table in a
+    `MemoryBackend`.
+    """
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+
+    def getSubTable(self, name):
+        return MemoryTable(self.backend, self.path + "/" + name)
+
+    def putValue(self, key, value):
+        return self.backend.put(self.path + "/" + key, value)
+
+    putNumber = putValue
+
+    def getValue(self, key, defaultValue):
+        return self.backend.values.get(self.path + "/" + key, defaultValue)
+
+    getNumber = getValue
+
+    def addEntryListener(self, listener, immediateNotify=False,
+                         localNotify=False):
+        self.backend.listen(self.path, listener, immediateNotify, localNotify)
+
+
+def _connection_changed(connected, info):
+    """
+    Called by NetworkTables (on its own thread) when we connect to (or lose)
+    the server. NetworkTables keeps trying to connect on its own.
+    """
+    if connected:
+        __connected.set()
+        _print("Connected to {0}".format(info.remote_ip))
+        send_status("connected")
+    else:
+        __connected.clear()
+        _print("Lost connection to NetworkTables server")
+    if __on_connection:
+        __on_connection(connected)
+
+
+def setup(server, name='vision', printtoo=False, on_connection=None,
+          backend=None):
     """
     Configures and connects to a NetworkTables service running
     on the server given (typically an IP address).
     It then connects to the table given by `name`.
+
+    This doesn't wait for the connection: values we send before then are
+    kept until the server is there. Call `is_connected` (or
+    `wait_connected`) to find out, or give an `on_connection` function, that
+    is called with True or False whenever the connection changes.
+
+    The `backend` is a `NetworkTablesBackend` unless we give another one
+    (like a `MemoryBackend`).
     """
-    global __table, __verbose
+    global __backend, __table, __verbose, __on_connection, __fudges
     __verbose = printtoo
+    __on_connection = on_connection
+    __backend = backend or NetworkTablesBackend()
+    __fudges = None
+    __connected.clear()
 
     # Initiates the connection, but won't say if it has connected.
-    NetworkTables.initialize(server=server)
-
-    __table = NetworkTables.getTable(name)
+    __backend.initialize(server)
 
-    while __table.getValue("status", None) is not "connecting":
-        send_status("connecting")
-        time.sleep(0.5)
-        _print("Connecting...")
+    __table = __backend.getTable(name)
+    send_status("connecting")
 
-    send_status("connected")
+    # Rather than checking over and over, NetworkTables tells us:
+    __backend.addConnectionListener(_connection_changed, immediateNotify=True)
     return __table
 
 
+def is_connected():
+    "Returns True if we are connected to the NetworkTables server."
+    return __connected.is_set()
+
+
+def wait_connected(timeout=None):
+    """
+    Waits until we are connected to the NetworkTables server, but no longer
+    than `timeout` seconds. Returns True if we are connected.
+    """
+    return __connected.wait(timeout)
+
+
 def send(key, value):
     """
     Sends a value to the NetworkTables.
@@ -52,6 +261,140 @@ def send(key, value):
         print("ERROR: {0}".format(e))
 
 
+def _put_all(values):
+    """
+    Puts every key and value in the `values` dictionary into our table, and
+    then asks NetworkTables to send them all together, right away.
+    """
+    if not __table:
+        raise Exception("Not connected to NetworkTables server. "
+                        "Run setup() first.")
+    for key, value in values.items():
+        __table.putValue(key, value)
+        _print("  - {0}: {1}".format(key, value))
+    __backend.flush()
+
+
+class Publisher:
+    """
+    Sends values to NetworkTables from a background thread, so the vision
+    loop never waits on the network (or on printing to the console):
+
+        publisher = tables.Publisher(rate=50).start()
+        while True:
+            ...
+            publisher.publish({'center_x': x, 'center_y': y})
+
+    Each call to `publish` replaces any values that haven't been sent yet,
+    so when we find targets faster than `rate` times a second, only the
+    newest values are sent. Values that haven't changed since they were
+    last sent are skipped.
+
+    If given, `ready` is called with a timeout (like `wait_connected`), and
+    nothing is sent until it returns True. Until then, the newest values
+    wait for us. When sending fails, we wait twice as long before each try
+    (starting at `min_backoff`, up to `max_backoff` seconds), rather than
+    hammering a broken network.
+
+    A `rate` of 0 means there is no limit: values are sent as soon as they
+    are published.
+    """
+    def __init__(self, rate=50, send=_put_all, ready=None, min_backoff=0.01,
+                 max_backoff=2.0):
+        if rate < 0:
+            raise ValueError("The publish rate can't be negative: {}"
+                             .format(rate))
+        self.period = 1.0 / rate if rate else 0
+        self.send = send
+        self.ready = ready
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.sent = {}       # The last value sent for each key
+        self._pending = {}   # Values waiting to be sent
+        self._lock = threading.Lock()
+        self._waiting = threading.Condition(self._lock)
+        self._sending = threading.Lock()  # Only one `flush` at a time
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        "Starts the publishing thread, and returns this publisher."
+        if not self._running:
+            self._running = True
+            self._thread = threading.Thread(target=self._run,
+                                            name="tables-publisher",
+                                            daemon=True)
+            self._thread.start()
+        return self
+
+    def publish(self, values):
+        "Queues a dictionary of keys and values to send. Never waits."
+        with self._lock:
+            self._pending.update(values)
+            self._waiting.notify()
+
+    def _take(self):
+        "Returns the pending values that changed since we last sent them."
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return {key: value for key, value in pending.items()
+                if self.sent.get(key) != value}
+
+    def flush(self):
+        """
+        Sends any pending (and changed) values right now, without waiting
+        for more. Returns False if sending failed, and the values wait to be
+        sent again (unless newer values replace them). This is safe to call
+        while the publishing thread is running.
+        """
+        with self._sending:
+            changed = self._take()
+            if changed:
+                try:
+                    self.send(changed)
+                    self.sent.update(changed)
+                except Exception as e:
+                    print("ERROR: {0}".format(e))
+                    with self._lock:
+                        for key, value in changed.items():
+                            self._pending.setdefault(key, value)
+                    return False
+        return True
+
+    def _run(self):
+        delay = self.period
+        while True:
+            with self._lock:
+                self._waiting.wait_for(lambda: self._pending or
+                                       not self._running)
+                if not self._running:
+                    break
+            started = time.monotonic()
+            if self.ready and not self.ready(self.max_backoff):
+                continue   # Not connected yet, the values keep waiting
+
+            if self.flush():
+                delay = self.period
+            else:
+                # Without a rate limit, the delay starts at zero, and
+                # doubling zero would never slow us down:
+                delay = min(max(delay * 2, self.min_backoff),
+                            self.max_backoff)
+
+            # Wait until it's time to send again:
+            time.sleep(max(0, delay - (time.monotonic() - started)))
+
+    def stop(self):
+        "Sends anything still pending, and stops the publishing thread."
+        with self._lock:
+            self._running = False
+            self._waiting.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
 def send_status(message="connected"):
     """
     Sends the NetworkTables connections status.
@@ -84,10 +427,57 @@ def send_fudge(key, value):
         print("ERROR: {0}".format(e))
 
 
+def _fudge_changed(source, key, value, isNew):
+    """
+    Called by NetworkTables (on its own thread) when a fudge value changes.
+    Makes a new copy of the fudges with the changed value.
+    """
+    global __fudges
+    fudges = dict(__fudges or {})
+    fudges[key] = value
+    __fudges = fudges
+
+
+def watch_fudges():
+    """
+    Instead of asking NetworkTables for the fudge values every time we need
+    them, NetworkTables tells us whenever one changes (which only happens a
+    few times in a match). Afterwards, `get_fudge` and `fudge_values` just
+    look at our own copy.
+    """
+    global __fudges
+    try:
+        if __table:
+            if __fudges is None:
+                __fudges = {}
+                fudges = __table.getSubTable("fudges")
+                # Notify us of the current values, as well as our own changes:
+                fudges.addEntryListener(_fudge_changed, immediateNotify=True,
+                                        localNotify=True)
+        else:
+            msg = "Not connected to NetworkTables server. Run setup() first."
+            raise Exception(msg)
+    except Exception as e:
+        print("ERROR: {0}".format(e))
+
+
+def fudge_values():
+    """
+    Returns a dictionary of the latest fudge values, once `watch_fudges` has
+    been called (otherwise None). The dictionary is never changed, so if a
+    call returns the same dictionary as last time, nothing has changed.
+    """
+    return __fudges
+
+
 def get_fudge(key, defaultValue=None):
     """
     Gets a value from the fudge subtable in NetworkTables.
     """
+    fudges = __fudges
+    if fudges is not None:
+        return fudges.get(key, defaultValue)
+
     try:
         if __table:
             fudges = __table.getSubTable("fudges")
@@ -1,6 +1,8 @@
 """ Finds Center of objects, and then it's position of either left or right """
 import cv2
+import numpy as np
 from lib import color_mask
+from lib.overlay import Overlay
 
 
 def target_size(roi, img=[]):
@@ -35,17 +37,30 @@ def find_contour_center(contour):
         return (0, 0)
 
 
-def offset_from_center(roi, img):
+def offset_from_center(roi, img, overlay=None):
     """
     Describes if the object is to the right, left, or straight in the middle
     of the screen, this is the same for the y coordinates of up and down.
     This could be used to help the line the object in the center of the screen.
+    The center is drawn on the `overlay`, if one is given.
     """
     cx, cy = find_contour_center(roi)
     center = (cx, cy)
-    cv2.circle(img, (cx, cy), 3, (0, 0, 255), 3)
+    if overlay is not None:
+        overlay.circle((cx, cy), 3, (0, 0, 255), 3)
     # The first two values of frame perameters (height and width)
     fh, fw = img.shape[:2]
+    xpos, x, ypos, y = directions(cx, cy, fw, fh)
+
+    return center, xpos, x, ypos, y
+
+
+def directions(cx, cy, fw, fh):
+    """
+    Given a center (cx, cy) in a frame of width `fw` and height `fh`,
+    returns the horizontal direction and distance from the middle of the
+    frame, followed by the vertical direction and distance.
+    """
     x = -fw/2+cx
     if x < 0:
         xpos = "left"
@@ -62,7 +77,7 @@ def offset_from_center(roi, img):
     else:
         ypos = "straight"
 
-    return center, xpos, x, ypos, y
+    return xpos, x, ypos, y
 
 
 def height_width(roi, img=[]):
@@ -83,37 +98,345 @@ def height_width(roi, img=[]):
     return height, width, orientation
 
 
-def single_target(img, orig=[]):
+class Features:
+    """
+    The measurements of a target's shape, all taken from its convex hull:
+
+      - `hull` is the convex hull itself (the contour with any dents
+        filled in)
+      - `area`, and the center of mass, `cx` and `cy`, from its moments
+      - `x`, `y`, `width` and `height` of its bounding box
+      - `circle` (the x, y center) and `radius` of its enclosing circle
+
+    Using `__slots__` keeps these small and quick to create.
+    """
+    __slots__ = ('hull', 'area', 'cx', 'cy', 'x', 'y', 'width', 'height',
+                 'circle', 'radius')
+
+
+def extract_features(contour):
+    """
+    Measures a contour, calculating its convex hull, moments, bounding box
+    and enclosing circle just once each, and returns them as `Features`.
+    """
+    f = Features()
+    f.hull = cv2.convexHull(contour)
+
+    M = cv2.moments(f.hull)
+    f.area = M['m00']
+    if f.area:
+        f.cx, f.cy = M['m10']/f.area, M['m01']/f.area
+    else:
+        f.cx, f.cy = 0.0, 0.0
+
+    f.x, f.y, f.width, f.height = cv2.boundingRect(f.hull)
+    f.circle, f.radius = cv2.minEnclosingCircle(f.hull)
+    return f
+
+
+# The measurements `extract_all_features` returns for each contour, as the
+# fields of a numpy _structured array_:
+FEATURE_FIELDS = np.dtype([
+    ('area', np.float64), ('cx', np.float64), ('cy', np.float64),
+    ('x', np.int32), ('y', np.int32), ('width', np.int32),
+    ('height', np.int32), ('radius', np.float64),
+])
+
+
+def extract_all_features(contours):
+    """
+    Measures many contours at once, returning a structured array with one
+    row of `FEATURE_FIELDS` for each contour, for instance:
+
+        features = extract_all_features(contours)
+        features['area']        # Every contour's area
+        features[0]['cx']       # The first contour's center
+
+    Instead of asking OpenCV for the moments and bounding box of each hull,
+    we put all the hulls' points in one array, and calculate all of them
+    together with numpy. The area and center come from the same formulas
+    `cv2.moments` uses for a polygon (the _shoelace_ formula).
+    """
+    hulls = [cv2.convexHull(c) for c in contours]
+    features = np.zeros(len(hulls), FEATURE_FIELDS)
+    if len(hulls) == 0:
+        return features
+
+    counts = np.array([len(h) for h in hulls])
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    points = np.concatenate(hulls).reshape(-1, 2).astype(np.float64)
+    x, y = points[:, 0], points[:, 1]
+
+    # The index of the next point around each hull, where the last point of
+    # a hull goes back to its first point:
+    following = np.arange(len(points)) + 1
+    following[starts + counts - 1] = starts
+    x1, y1 = x[following], y[following]
+
+    cross = x * y1 - x1 * y
+    m00 = np.add.reduceat(cross, starts) / 2
+    m10 = np.add.reduceat((x + x1) * cross, starts) / 6
+    m01 = np.add.reduceat((y + y1) * cross, starts) / 6
+
+    # A flat hull (a line or a single point) has no area and no center:
+    flat = m00 == 0
+    m00[flat] = 1
+    features['area'] = np.abs(np.where(flat, 0, m00))
+    features['cx'] = np.where(flat, 0, m10 / m00)
+    features['cy'] = np.where(flat, 0, m01 / m00)
+
+    left = np.minimum.reduceat(x, starts)
+    top = np.minimum.reduceat(y, starts)
+    features['x'] = left
+    features['y'] = top
+    features['width'] = np.maximum.reduceat(x, starts) - left + 1
+    features['height'] = np.maximum.reduceat(y, starts) - top + 1
+
+    # There is no shortcut for the enclosing circle, but the hulls have
+    # few points:
+    features['radius'] = [cv2.minEnclosingCircle(h)[1] for h in hulls]
+    return features
+
+
+def draw_features(f, overlay):
+    """
+    Records the outline (in green), the enclosing circle and bounding box
+    (in blue), and the center (in red) of a target's `Features` on an
+    `Overlay`, and returns the overlay.
+    """
+    if overlay.active:
+        overlay.contours([f.hull], (0, 255, 0), 4)
+        overlay.circle(f.circle, round(f.radius), (255, 0, 0), 8)
+        overlay.rectangle((f.x, f.y), (f.x+f.width, f.y+f.height),
+                          (255, 0, 0), 4)
+        overlay.circle((f.cx, f.cy), 3, (0, 0, 255), 3)
+    return overlay
+
+
+def target_from_features(f, fw, fh):
+    """
+    Converts `Features` into the target dictionary `single_target` returns,
+    for a frame `fw` pixels wide and `fh` pixels high.
+    """
+    cx, cy = int(f.cx), int(f.cy)
+    xpos, x, ypos, y = directions(cx, cy, fw, fh)
+
+    if f.width > f.height:
+        orientation = "horizontal"
+    else:
+        orientation = "vertical"
+
+    return {
+        'center': {'x': cx, 'y': cy},
+        'size': round(f.radius),
+        'height': f.height,
+        'width': f.width,
+        'orientation': orientation,
+        'xpos': [xpos, x],
+        "ypos": [ypos, y]
+    }
+
+
+def single_target(img, orig=[], min_area=0, overlay=None):
     """
     Logic to find the center of a single target, such as a powercube.
     Returns center of object (x,y coordinate on image frame), size,
-    and orientation of object.
+    and orientation of object. Shapes smaller than `min_area` pixels are
+    ignored.
+
+    Nothing is drawn, unless an `overlay` is given (see `lib/overlay.py`),
+    or an `orig` image to draw on right away.
     """
 
-    contours = color_mask.get_contours(img)
+    contours, _ = color_mask.largest_contours(img, 1, min_area)
 
     if len(contours) > 0:
-        # ROI = region of interest, ie. largest contour (last in contours list)
-        contour = contours[-1]
-        roi = cv2.convexHull(contour)
+        # ROI = region of interest, ie. largest contour (first in the list)
+        f = extract_features(contours[0])
 
-        # Surround the contour shape in green:
         if len(orig) > 0:
-            cv2.drawContours(orig, [roi], 0, (0, 255, 0), 4)
-
-        size = target_size(roi, orig)
-        width, height, orientation = height_width(roi, orig)
-        center, xpos, x, ypos, y = offset_from_center(roi, img)
-
-        return {
-            'center': {'x': center[0], 'y': center[1]},
-            'size': size,
-            'height': height,
-            'width': width,
-            'orientation': orientation,
-            'xpos': [xpos, x],
-            "ypos": [ypos, y]
-        }
+            draw_features(f, Overlay()).render(orig)
+        elif overlay is not None:
+            draw_features(f, overlay)
+
+        fh, fw = img.shape[:2]
+        return target_from_features(f, fw, fh)
+
+
+def component_target(img, orig=[], min_area=0, overlay=None):
+    """
+    Like `single_target`, but uses `color_mask.largest_components` instead
+    of contours, which is faster when a mask has lots of small specks. The
+    center is the center of the target's pixels, and the size is half of
+    its bounding box's diagonal, rather than the radius of the smallest
+    enclosing circle, so the values are close to, but not exactly the same
+    as what `single_target` returns.
+    """
+    boxes, _, centers = color_mask.largest_components(img, 1, min_area)
+    if len(boxes) == 0:
+        return None
+
+    bx, by, width, height = (int(v) for v in boxes[0])
+    cx, cy = (int(v) for v in centers[0])
+
+    draw = Overlay() if len(orig) > 0 else overlay
+    if draw is not None:
+        draw.rectangle((bx, by), (bx+width, by+height), (255, 0, 0), 4)
+        draw.circle((cx, cy), 3, (0, 0, 255), 3)
+        if len(orig) > 0:
+            draw.render(orig)
+    fh, fw = img.shape[:2]
+    xpos, x, ypos, y = directions(cx, cy, fw, fh)
+
+    if width > height:
+        orientation = "horizontal"
+    else:
+        orientation = "vertical"
+
+    return {
+        'center': {'x': cx, 'y': cy},
+        'size': round((width ** 2 + height ** 2) ** 0.5 / 2),
+        'height': height,
+        'width': width,
+        'orientation': orientation,
+        'xpos': [xpos, x],
+        "ypos": [ypos, y]
+    }
+
+
+# The ways we can find a target in a mask, by the names in the config file:
+FINDERS = {
+    "contours": single_target,
+    "components": component_target,
+}
+
+
+def get_finder(name):
+    "Returns the finder function called `name` in `FINDERS`."
+    if name not in FINDERS:
+        raise ValueError("Unknown target finder: {}".format(name))
+    return FINDERS[name]
+
+
+def color_targets(masks, orig=[], min_area=0, finder=single_target,
+                  overlay=None):
+    """
+    Given a dictionary of masks for each color (see `Pipeline.masks`),
+    returns a dictionary with the single target for each color (or None if
+    that color wasn't found).
+    """
+    return {name: finder(mask, orig, min_area, overlay)
+            for name, mask in masks.items()}
+
+
+def scale_target(target, scale):
+    """
+    When we look for targets in a shrunken frame, the positions and sizes
+    are in the shrunken frame's pixels. Multiplying by `scale` (the full
+    frame's width divided by the shrunken width) gives a target in the
+    camera's full resolution.
+    """
+    if target is None or scale == 1:
+        return target
+
+    xpos, x = target['xpos']
+    ypos, y = target['ypos']
+    return dict(target,
+                center={'x': round(target['center']['x'] * scale),
+                        'y': round(target['center']['y'] * scale)},
+                size=round(target['size'] * scale),
+                height=round(target['height'] * scale),
+                width=round(target['width'] * scale),
+                xpos=[xpos, x * scale],
+                ypos=[ypos, y * scale])
+
+
+def shift_target(target, dx, dy, fw, fh):
+    """
+    Moves a target found in a window of a frame (starting at `dx`, `dy`)
+    into the frame itself, which is `fw` pixels wide and `fh` pixels high.
+    """
+    cx = target['center']['x'] + dx
+    cy = target['center']['y'] + dy
+    xpos, x, ypos, y = directions(cx, cy, fw, fh)
+    return dict(target, center={'x': cx, 'y': cy},
+                xpos=[xpos, x], ypos=[ypos, y])
+
+
+class TargetTracker:
+    """
+    Once we have found a target, it probably won't move far before the next
+    frame, so there is no reason to search the whole frame again. A tracker
+    remembers where the target was, and only masks a window around it:
+
+        tracker = TargetTracker()
+        while True:
+            small = pipeline.shrink(pipeline.read(camera))
+            target = tracker.track(small, pipeline.mask_window)
+
+    The `mask_window` function is given the frame and the window's x, y,
+    width and height (or just the frame, to search all of it), and returns
+    the mask of the window. The window is the target's size, plus `margin`
+    times its size on each side. If the target isn't in the window for
+    `max_misses` frames in a row, we go back to searching the whole frame.
+    """
+
+    # Windows are always at least this many pixels bigger than the target:
+    PADDING = 8
+
+    def __init__(self, margin=1.0, max_misses=5, min_area=0,
+                 finder=single_target):
+        self.margin = margin
+        self.max_misses = max_misses
+        self.min_area = min_area
+        self.finder = finder
+
+        self.window = None  # The (x, y, width, height) to search next
+        self.misses = 0     # Frames in a row the target wasn't found
+
+    def reset(self):
+        "Forget the last target, and search the whole next frame."
+        self.window = None
+        self.misses = 0
+
+    def track(self, img, mask_window, overlay=None):
+        """
+        Returns the target (see `single_target`) found in the frame, `img`,
+        or None. The target is drawn on the `overlay`, if given.
+        """
+        fh, fw = img.shape[:2]
+
+        if self.window is None:
+            target = self.finder(mask_window(img), [], self.min_area, overlay)
+        else:
+            x, y, width, height = self.window
+            mask = mask_window(img, x, y, width, height)
+            if overlay is not None:
+                overlay.origin = (x, y)
+            target = self.finder(mask, [], self.min_area, overlay)
+            if overlay is not None:
+                overlay.origin = (0, 0)
+            if target is not None:
+                target = shift_target(target, x, y, fw, fh)
+
+        if target is None:
+            self.misses += 1
+            if self.misses >= self.max_misses:
+                self.reset()
+            return None
+
+        self.misses = 0
+        self.window = self._window_around(target, fw, fh)
+        return target
+
+    def _window_around(self, target, fw, fh):
+        "Returns the window to search for the target in the next frame."
+        reach = int(target['size'] * (1 + self.margin)) + self.PADDING
+        cx, cy = target['center']['x'], target['center']['y']
+
+        x0, y0 = max(0, cx - reach), max(0, cy - reach)
+        x1, y1 = min(fw, cx + reach + 1), min(fh, cy + reach + 1)
+        return x0, y0, x1 - x0, y1 - y0
 
 
 def double_target(img):
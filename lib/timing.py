@@ -0,0 +1,100 @@
+"""
+Measures how long each step (or _stage_) of our vision loop takes, so we
+can tell which one is using up our time for each frame:
+
+    timer = StageTimer()
+    while True:
+        t = timer.start()
+        img = pipeline.read(camera)
+        t = timer.stage("capture", t)
+        target = target_tracker.single_target(pipeline.mask(img))
+        t = timer.stage("target", t)
+
+Each stage remembers its most recent times (the last `window` of them), and
+`report` gives the median (p50), as well as the p95 and p99 times in
+milliseconds: 95% (or 99%) of the frames took less time than that.
+
+When we don't want to measure anything, use `OFF` instead of a timer. It
+has the same methods, but they don't do anything.
+"""
+
+import json
+import time
+import numpy as np
+
+# The percentiles we report for every stage:
+PERCENTILES = (50, 95, 99)
+
+
+class StageTimer:
+    """
+    Keeps the last `window` times (in nanoseconds) of every stage.
+    """
+    def __init__(self, window=300):
+        self.window = window
+        self.times = {}    # A circular array of times for each stage
+        self.counts = {}   # How many times each stage has been measured
+
+    def start(self):
+        "Returns the time right now, to give to the first `stage`."
+        return time.perf_counter_ns()
+
+    def stage(self, name, started):
+        """
+        Records the time since `started` as the time of the `name` stage,
+        and returns the time right now, which is when the next stage starts.
+        """
+        now = time.perf_counter_ns()
+        times = self.times.get(name)
+        if times is None:
+            times = self.times[name] = np.zeros(self.window, np.int64)
+            self.counts[name] = 0
+        count = self.counts[name]
+        times[count % self.window] = now - started
+        self.counts[name] = count + 1
+        return now
+
+    def percentiles(self, name):
+        "Returns the p50, p95 and p99 times of a stage, in milliseconds."
+        count = min(self.counts[name], self.window)
+        return np.percentile(self.times[name][:count], PERCENTILES) / 1e6
+
+    def report(self, prefix="timing/"):
+        """
+        Returns a dictionary of the percentiles of every stage, with keys
+        like `timing/capture/p95`, ready to publish to NetworkTables.
+        """
+        values = {}
+        for name in self.times:
+            for p, ms in zip(PERCENTILES, self.percentiles(name)):
+                values["{}{}/p{}".format(prefix, name, p)] = float(ms)
+        return values
+
+    def log(self, outfile):
+        """
+        Writes the percentiles of every stage as a single line of JSON to
+        the open `outfile`, along with the time and the number of frames.
+        """
+        line = {"time": time.time(), "counts": dict(self.counts)}
+        line.update(self.report(prefix=""))
+        outfile.write(json.dumps(line) + "\n")
+        outfile.flush()
+
+
+class NoTimer:
+    "Looks like a `StageTimer`, but measures nothing."
+    def start(self):
+        return 0
+
+    def stage(self, name, started):
+        return 0
+
+    def report(self, prefix="timing/"):
+        return {}
+
+    def log(self, outfile):
+        pass
+
+
+# Use this when timing is switched off:
+OFF = NoTimer()
@@ -10,6 +10,20 @@ import time
 # Shrink the frame width and height to this size:
 FRAME_WIDTH_GOAL = 300
 
+# The width (and height) in pixels of the blur that smooths out camera noise.
+# Each blurred pixel looks at the pixels up to half of this away:
+BLUR_SIZE = 11
+
+# The ways OpenCV can shrink a frame, by the names we use in the config file.
+# The `area` style averages the pixels it combines, and looks the best when
+# shrinking, but `nearest` (just skip pixels) is the fastest:
+INTERPOLATION = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "area": cv2.INTER_AREA,
+    "cubic": cv2.INTER_CUBIC,
+}
+
 
 def has_pressed(key, letter):
     """
@@ -51,16 +65,130 @@ def calibration(filename="calibration-values.npz"):
     return cal["mtx"], cal["dist"], cal["newcammtx"]
 
 
-def get_video(channel=1):
+# The camera settings we can give in our configuration, and the OpenCV
+# property each one sets. They are set in this order, as some cameras only
+# offer the larger sizes (or the higher frame rates) with some FOURCCs:
+CAMERA_SETTINGS = {
+    "fourcc": cv2.CAP_PROP_FOURCC,
+    "width": cv2.CAP_PROP_FRAME_WIDTH,
+    "height": cv2.CAP_PROP_FRAME_HEIGHT,
+    "fps": cv2.CAP_PROP_FPS,
+    "auto_exposure": cv2.CAP_PROP_AUTO_EXPOSURE,
+    "exposure": cv2.CAP_PROP_EXPOSURE,
+    "buffersize": cv2.CAP_PROP_BUFFERSIZE,
+}
+
+
+def fourcc_name(code):
+    "Turns a FOURCC number (from `camera.get`) back into letters, like MJPG."
+    code = int(code)
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+
+
+def configure_camera(camera, settings):
+    """
+    Asks the camera to use the `settings`, a dictionary that may have:
+
+        fourcc:        The format of the frames, like MJPG (compressed, so
+                       less to send over USB) or YUYV
+        width, height: The size of the frames
+        fps:           Frames per second
+        exposure:      How long each frame is exposed (what the number
+                       means depends on the camera)
+        auto_exposure: 1 for manual exposure with the V4L2 drivers on Linux
+                       (some older drivers want 0.25), 3 for automatic. If
+                       we give an `exposure`, this is 1 unless given.
+        buffersize:    How many frames the driver keeps for us (1 means we
+                       always get a recent frame)
+
+    Cameras often ignore settings they don't support, so we read each one
+    back, and print the ones that are different. Returns a dictionary of
+    what we asked for, and what we got, for each setting.
+    """
+    settings = dict(settings)
+    if "exposure" in settings:
+        settings.setdefault("auto_exposure", 1)
+
+    unknown = set(settings) - set(CAMERA_SETTINGS)
+    if unknown:
+        raise ValueError("Unknown camera settings: {}".format(
+            ", ".join(sorted(unknown))))
+
+    report = {}
+    for name, prop in CAMERA_SETTINGS.items():
+        if name not in settings:
+            continue
+        wanted = settings[name]
+        if name == "fourcc":
+            camera.set(prop, cv2.VideoWriter_fourcc(*wanted))
+            got = fourcc_name(camera.get(prop))
+        else:
+            camera.set(prop, wanted)
+            got = camera.get(prop)
+        report[name] = (wanted, got)
+        if got != wanted:
+            print("Camera setting {}: asked for {}, but got {}".format(
+                name, wanted, got))
+    return report
+
+
+def frame_size(camera):
+    """
+    Returns the width and height of the frames a camera (or frame source)
+    gives us, as a tuple.
+    """
+    return (camera.get(cv2.CAP_PROP_FRAME_WIDTH),
+            camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+
+def shrunk_size(width, height, goal=FRAME_WIDTH_GOAL):
+    """
+    Returns the width and height a frame will have after `shrink`ing it to
+    the `goal` width (keeping the same shape). Frames are never enlarged.
+    """
+    if not goal or width <= goal:
+        return int(width), int(height)
+    return int(goal), int(round(height * goal / width))
+
+
+def shrink(img, goal=FRAME_WIDTH_GOAL, interpolation=cv2.INTER_AREA,
+           dst=None):
+    """
+    Resizes an image to have a width of `goal` pixels. Every step after
+    this (blurring, converting to HSV, masking and finding contours) has
+    fewer pixels to look at, so this speeds up everything else. If `goal` is
+    `None`, or the image isn't wider, the image is returned unchanged.
+
+    If given, the shrunken image is written into `dst` (which must already
+    have the right size) instead of a new array.
+    """
+    height, width = img.shape[:2]
+    size = shrunk_size(width, height, goal)
+    if size == (width, height):
+        return img
+    return cv2.resize(img, size, dst=dst, interpolation=interpolation)
+
+
+def get_video(channel=1, goal=FRAME_WIDTH_GOAL, settings=None):
     """
     Returns a camera frame. This should be called once at the
     beginning of your program, and the results are passed to
-    most other functions in this module.
+    most other functions in this module. The width and height returned
+    are the size of the frames after they have been shrunk to `goal`.
+
+    The `channel` can also be a frame source that is already open (see
+    `lib/sources.py`), for instance, a directory of images. Otherwise, the
+    camera is opened with the `settings`, if given (see `configure_camera`).
     """
-    # initialize the camera and grab a reference to the raw camera capture
-    camera = cv2.VideoCapture(channel)
-    # allow the camera to warmup
-    time.sleep(0.1)
+    if hasattr(channel, "read"):
+        camera = channel
+    else:
+        # initialize the camera and grab a reference to the raw camera capture
+        camera = cv2.VideoCapture(channel)
+        if settings:
+            configure_camera(camera, settings)
+        # allow the camera to warmup
+        time.sleep(0.1)
 
     # If you need to flip the camera view (camera needs to be upside down
     # include:
@@ -69,30 +197,57 @@ def get_video(channel=1):
     #    frame = cv2.flip(frame,0)
     #    out.write(frame)
 
-    orig_width = camera.get(cv2.CAP_PROP_FRAME_WIDTH)
-    orig_height = camera.get(cv2.CAP_PROP_FRAME_HEIGHT)
-    height = orig_height * orig_width/FRAME_WIDTH_GOAL
-    print("Frame width:", FRAME_WIDTH_GOAL, " Frame height:", height)
+    orig_width, orig_height = frame_size(camera)
+    width, height = shrunk_size(orig_width, orig_height, goal)
+    print("Frame width:", width, " Frame height:", height)
 
-    return [camera, FRAME_WIDTH_GOAL, height]
+    return [camera, width, height]
 
 
-def get_hsv(camera):
+def read_frame(camera, image=None):
     """
-    Grab a frame and convert to hsv.
+    Grab a frame from the camera, waiting until one is available. If given,
+    the frame is read into `image`. Raises `EOFError` if the camera has
+    closed (for instance, a video file that has finished).
     """
     got_image = False
     while not got_image:
-        got_image, img = camera.read()
+        got_image, img = camera.read(image)
+        # A camera that fails to read a frame may work the next time, but
+        # a replayed video that has run out of frames will not:
+        if not got_image and not camera.isOpened():
+            raise EOFError("No more frames to read from the camera")
+    return img
+
+
+def blur(img, dst=None):
+    """
+    Blur an image to smooth out the camera's noise. If given, the blurred
+    image is written into `dst`.
+    """
+    return cv2.GaussianBlur(img, (BLUR_SIZE, BLUR_SIZE), 0, dst=dst)
+
+
+def to_hsv(img, blurred=None, dst=None):
+    """
+    Blur an image (to smooth out the camera's noise) and convert it to the
+    HSV color space. The `blurred` and `dst` arrays, if given, are used to
+    hold the blurred and the HSV images, instead of new arrays.
+    """
+    blurred = blur(img, blurred)
+    return cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV, dst=dst)
 
-    # h, w, c = frame.shape
-    # width = 600
-    # height = int((w/600)*h)
 
-    # frame = cv2.resize(frame, (width, height))
+def get_hsv(camera, goal=FRAME_WIDTH_GOAL, interpolation=cv2.INTER_AREA):
+    """
+    Grab a frame, shrink it to the `goal` width, and convert to hsv.
+    Returns both the hsv and the shrunken image. Raises `EOFError` if the
+    camera has closed (for instance, a video file that has finished).
+    """
+    img = read_frame(camera)
+    img = shrink(img, goal, interpolation)
 
     # convert to HSV color space
-    blurred = cv2.GaussianBlur(img, (11, 11), 0)
-    hsv_img = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
+    hsv_img = to_hsv(img)
 
     return hsv_img, img
@@ -4,8 +4,11 @@ a network table.
 Use `java -jar support/OutlineViewer-1.0.1.jar` in terminal to create a local
 server, once you have everything installed (see README)
 """
-from lib import config, tables, target_tracker, color_mask, util
-from time import sleep
+from lib import config, tables, target_tracker, color_mask, util, capture
+from lib import parallel, recorder, sources, timing
+from lib.pipeline import Pipeline
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic, time
 import argparse
 
 # The `debug` global variable is a number that corresponds to how much
@@ -24,6 +27,9 @@ fudges = {"center_x": 0,
           "center_y": 0
           }
 
+# The last fudge values we received from NetworkTables (see `update_fudges`):
+seen_fudges = None
+
 
 def debug_message(level, *msg):
     """
@@ -53,49 +59,406 @@ def run(cfg):
     fudges["center_x"] = cfg.get_default("fudges", "center_x", 0)
     fudges["center_y"] = cfg.get_default("fudges", "center_y", 0)
 
+    # Changed fudges are saved from a background thread, so the loop never
+    # waits for the disk:
+    cfg.write_behind(cfg.get_default("save_delay", 1.0))
+
     channel = cfg.get_default('channel', 0)
     server = cfg.get_default('networktables', '10.27.33.2')
-    lu = cfg.get("color", "yellow")
-    lower, upper = color_mask.unpack_range(lu)
 
-    camera, width, height = util.get_video(channel)
-    debug_message(1, "camera:", camera)
+    # The `track` list names the colors (from the `color` section) to look
+    # for. The first color's target is also sent with our original keys:
+    track = cfg.get_default("track", ["yellow"])
+
+    def compile_colors(section):
+        return color_mask.unpack_ranges(section, track)
+
+    colors = cfg.view("color", compile_colors)
+    lower, upper = colors[track[0]]
+
+    # We check if someone edited the configuration file at most this often
+    # (in seconds), and use the new color ranges (0 turns this off):
+    reload_interval = cfg.get_default("reload_interval", 1.0)
+    last_reload = time()
+
+    # Frames are shrunk to this width before we look at them, as that makes
+    # every step afterwards faster:
+    goal = cfg.get_default("pipeline", "width", util.FRAME_WIDTH_GOAL)
+    style = cfg.get_default("pipeline", "interpolation", "area")
+    interpolation = util.INTERPOLATION[style]
+
+    # A `cameras` list (see `run_cameras`) replaces the single camera:
+    cameras = cfg.get_default("cameras", [])
+    if cameras:
+        # Without a `source`, each entry is a camera (with a `channel` and
+        # maybe `settings`) itself:
+        camera = capture.CameraGroup(
+            sources.open_source(spec.get("source", spec),
+                                spec.get("channel", i))
+            for i, spec in enumerate(cameras))
+        for spec, source in zip(cameras, camera.cameras):
+            if getattr(source, "settings", None):
+                debug_message(1, spec.get("name", "camera"), "settings:",
+                              source.settings)
+    else:
+        camera = open_camera(cfg, channel, goal)
+
+    # With `tables_backend: memory`, nothing is sent over the network, which
+    # is handy for replaying recorded frames on a laptop:
+    backend = None
+    if cfg.get_default("tables_backend", "networktables") == "memory":
+        backend = tables.MemoryBackend()
 
     if debug >= 2:
-        tables.setup(server, printtoo=True)
+        tables.setup(server, printtoo=True, backend=backend)
     else:
-        tables.setup(server)
+        tables.setup(server, backend=backend)
 
-    # We need to wait a bit for both the camera and the NetworkTables server
-    # to "come online", so let's add a wee kludge and wait 5 seconds:
-    sleep(5)
+    # We don't wait for the NetworkTables server: NetworkTables keeps what we
+    # send until it connects, and reading the camera waits for the first
+    # frame, so we start looking for targets right away.
 
     # Send our fudgys and then put them into the NetworkTables, so that
     # we could change them if we want to.
     tables.send_fudge("center_x", fudges['center_x'])
     tables.send_fudge("center_y", fudges['center_y'])
 
-    frame_width = width/2 # This is to calculate the offset in the next function
+    # From now on, NetworkTables tells us when a fudge changes:
+    tables.watch_fudges()
+
+    # Targets are sent from a background thread, at most `publish_rate`
+    # times a second, so we never wait on the network. Until we connect,
+    # only the newest target is kept:
+    publisher = tables.Publisher(cfg.get_default("publish_rate", 50),
+                                 ready=tables.wait_connected).start()
+
+    # With `timing: {enabled: true}`, we measure how long each stage of the
+    # loop takes, and every `interval` seconds, send the times to
+    # NetworkTables (under `timing/`) and add them to the `log` file:
+    timer = timing.OFF
+    timing_log = None
+    if cfg.get_default("timing", "enabled", False):
+        timer = timing.StageTimer(cfg.get_default("timing", "window", 300))
+        if cfg.get_default("timing", "log", None):
+            timing_log = open(cfg.get("timing", "log"), "a")
+    timing_interval = cfg.get_default("timing", "interval", 5.0)
+    last_timing = time()
+
+    # All of the images our pipeline needs for each frame are created once,
+    # right here, and re-used for every frame:
+    engine = cfg.get_default("pipeline", "engine", "hsv")
+    several = colors if len(colors) > 1 else None
+    # With `stripes`, each frame is split up and worked on by that many
+    # threads at once:
+    stripes = cfg.get_default("pipeline", "stripes", 0)
+    # The `channel` engine (for reflective tape) only looks for bright
+    # pixels, with settings like {channel: green, minus: red, threshold: 60}:
+    channel_engine = cfg.get_default("pipeline", "channel", None)
+    full_width, full_height = util.frame_size(camera)
+
+    # This is to calculate the offset in `target_values`. Some sources don't
+    # know their size until we read a frame, so then we use the first one:
+    frame_width = full_width / 2
+
+    # Specks smaller than `min_area` pixels (in the shrunken frame) are never
+    # a target, and the `finder` is either `contours` or `components`:
+    min_area = cfg.get_default("pipeline", "min_area", 0)
+    finder = target_tracker.get_finder(cfg.get_default("pipeline", "finder",
+                                                       "contours"))
+
+    # Once we've found a (single color) target, we can search just a window
+    # around where it was, until we lose it for `roi_misses` frames:
+    tracker = None
+    if cfg.get_default("pipeline", "roi", False) and not several:
+        margin = cfg.get_default("pipeline", "roi_margin", 1.0)
+        misses = cfg.get_default("pipeline", "roi_misses", 5)
+        tracker = target_tracker.TargetTracker(margin, misses, min_area,
+                                               finder)
+
+    # With `workers`, frames of a single color are looked at by that many
+    # processes at the same time (see `lib/parallel.py`):
+    workers = cfg.get_default("pipeline", "workers", 0)
 
-    while True:
-        hsv, _ = util.get_hsv(camera)
-        masked_img = color_mask.get_mask(hsv, lower, upper)
-        target = target_tracker.single_target(masked_img)
+    try:
+        if cameras:
+            warn_ignored(cfg, "several cameras", CAMERAS_IGNORE)
+            if len(track) > 1:
+                print("WARNING: With several cameras, each camera only "
+                      "looks for its own `color`, not every tracked color")
+            return run_cameras(camera, cameras, cfg, publisher, track[0],
+                               goal, interpolation, engine, min_area, finder)
 
-        send_target_data(target, frame_width)
-        update_fudges(tables, cfg)
+        if workers and several:
+            print("WARNING: pipeline workers only look for a single color, "
+                  "so they aren't used when tracking several colors")
+        elif workers:
+            warn_ignored(cfg, "pipeline workers", WORKERS_IGNORE)
+            frames = parallel.ParallelPipeline(
+                camera, lower, upper, workers, goal=goal,
+                interpolation=interpolation, engine=engine,
+                channel=channel_engine, min_area=min_area, finder=finder)
+            return run_parallel(frames, publisher, cfg)
 
+        pipeline = Pipeline(lower, upper, goal, interpolation, engine,
+                            colors=several, timer=timer, stripes=stripes,
+                            channel=channel_engine)
+        if full_width:
+            pipeline.allocate(full_width, full_height)
 
-def send_target_data(target, frame_width):
+        while True:
+            t = timer.start()
+            img = pipeline.read(camera)
+            t = timer.stage("capture", t)
+            if not frame_width:
+                frame_width = img.shape[1] / 2
+            if pipeline.multi:
+                masks = pipeline.masks(img)
+                t = timer.start()
+                targets = target_tracker.color_targets(masks, [], min_area,
+                                                       finder)
+            elif tracker:
+                small = pipeline.shrink(img)
+                t = timer.start()
+                target = tracker.track(small, pipeline.mask_window)
+                targets = {track[0]: target}
+            else:
+                masked_img = pipeline.mask(img)
+                t = timer.start()
+                targets = {track[0]: finder(masked_img, [], min_area)}
+            # (The tracker masks its window in this stage, too)
+            t = timer.stage("target", t)
+
+            snapshot = {}
+            for name, target in targets.items():
+                # Targets are found in the shrunken frame, but we report
+                # them in the camera's full resolution:
+                target = target_tracker.scale_target(target, pipeline.scale)
+                debug_message(2, name, target)
+                if name == track[0]:
+                    snapshot.update(target_values(target, frame_width))
+                if several:
+                    snapshot.update(target_values(target, frame_width,
+                                                  name + "/"))
+            publisher.publish(snapshot)
+            timer.stage("publish", t)
+
+            update_fudges(tables, cfg)
+
+            if timer is not timing.OFF and \
+                    time() - last_timing > timing_interval:
+                last_timing = time()
+                publisher.publish(timer.report())
+                if timing_log:
+                    timer.log(timing_log)
+
+            # Between frames is the safe time to swap in new color ranges:
+            if reload_interval and time() - last_reload > reload_interval:
+                last_reload = time()
+                if "color" in cfg.reload_if_changed():
+                    try:
+                        colors = cfg.view("color", compile_colors)
+                    except KeyError as e:
+                        # Someone removed a color we track (or the whole
+                        # section), so we keep using the ranges we had:
+                        print("ERROR: Can't reload colors, missing:", e)
+                        continue
+                    debug_message(1, "Reloaded colors:", colors)
+                    pipeline.set_ranges(*colors[track[0]],
+                                        colors if several else None)
+    except EOFError:
+        # Only replayed frame sources (images and videos) run out of frames
+        debug_message(1, "Finished reading frames")
+    finally:
+        publisher.stop()
+        camera.release()
+        cfg.close()
+        if timing_log:
+            timing_log.close()
+
+
+def open_camera(cfg, channel, goal):
     """
-    Send the target information over to the NetworkTables (using the `tables`
-    interface) including any fudge factor offsets.
+    Opens the camera (or the frame source from the `source` section of our
+    configuration), recording it and reading it on its own thread, if the
+    configuration asks us to.
+    """
+    # The `source` section in the config can replace the camera with a
+    # directory of images or a video file (great for testing):
+    source = sources.from_config(cfg, channel)
+
+    camera, width, height = util.get_video(source, goal)
+    debug_message(1, "camera:", camera)
+
+    # The camera `settings` (if any) and what the camera accepted, for
+    # instance, `fourcc: (MJPG, MJPG)` or `width: (320, 640.0)`:
+    if getattr(source, "settings", None):
+        debug_message(1, "camera settings:", source.settings)
+
+    # With a `record` section, every frame we capture is saved to an archive
+    # (see `lib/recorder.py`) that we can replay later with an `archive`
+    # source. The archive is made for the size of the first frame the camera
+    # actually gives us (which may not be the size it says it has):
+    if cfg.get_default("record", "path", None):
+        archive = recorder.Recorder(cfg.get("record", "path"),
+                                    capacity=cfg.get_default(
+                                        "record", "capacity", 1000))
+        camera = recorder.RecordingSource(camera, archive)
+
+    # Reading the camera on its own thread means we always process the
+    # newest frame, and capturing overlaps with our image analysis. Replayed
+    # frames are read directly, so that none of them are skipped:
+    live = cfg.get_default("source", "type", "camera") == "camera"
+    if cfg.get_default("threaded_capture", live):
+        camera = capture.FrameGrabber(camera).start()
+    return camera
+
+
+def run_cameras(group, specs, cfg, publisher, color, goal, interpolation,
+                engine, min_area, finder):
+    """
+    Looks for targets with every camera in a `capture.CameraGroup`, where
+    `specs` is the `cameras` list from our configuration, for instance:
+
+        cameras:
+          - name: front
+            channel: 0
+            settings: {width: 320, height: 240, fourcc: MJPG}
+          - name: rear
+            channel: 1
+            color: green
+
+    Each camera has its own pipeline, looks for its own `color` (or the
+    first color we track), and sends its targets with its `prefix` (or its
+    name and a slash, like `rear/center_x`). Frames are looked at by a pool
+    of `workers` threads (one for each camera, unless the `pipeline`
+    section says otherwise). While a live camera's last frame is still
+    being looked at, its new frames are grabbed, but not decoded, so the
+    next frame we look at is a fresh one. Replayed frames are never
+    skipped, we wait for the workers instead.
+    """
+    pipelines, prefixes, frame_widths = [], [], []
+    for i, spec in enumerate(specs):
+        lower, upper = color_mask.unpack_range(
+            cfg.get("color", spec.get("color", color)))
+        pipeline = Pipeline(lower, upper, goal, interpolation, engine,
+                            channel=cfg.get_default("pipeline", "channel",
+                                                    None))
+        width, height = util.frame_size(group.cameras[i])
+        if width:
+            pipeline.allocate(width, height)
+        pipelines.append(pipeline)
+        frame_widths.append(width / 2)
+        name = spec.get("name", "camera{}".format(i))
+        prefixes.append(spec.get("prefix", name + "/"))
+
+    def look(i, frame):
+        "Finds the target in a frame from camera `i`."
+        pipeline = pipelines[i]
+        target = finder(pipeline.mask(frame), [], min_area)
+        return target_tracker.scale_target(target, pipeline.scale)
+
+    busy = {}      # The job looking at each camera's frame
+    grabbed = {}   # When each of those frames was grabbed
+
+    def publish_finished(everything=False):
+        "Publishes the targets of the jobs that are done."
+        if everything:
+            wait(busy.values())
+        for i, job in list(busy.items()):
+            if job.done():
+                del busy[i]
+                target = job.result()
+                debug_message(2, prefixes[i], target,
+                              "({:.3f} seconds after grabbing)"
+                              .format(monotonic() - grabbed.pop(i)))
+                publisher.publish(target_values(target, frame_widths[i],
+                                                prefixes[i]))
+
+    live = all(spec.get("source", {}).get("type", "camera") == "camera"
+               for spec in specs)
+    workers = cfg.get_default("pipeline", "workers", 0) or len(specs)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            while True:
+                publish_finished(everything=not live)
+
+                # Every camera is grabbed (so a busy camera doesn't fill up
+                # with old frames), but only the free ones are decoded, into
+                # the pipelines' own frame buffers. Grabbing from a live
+                # camera waits for its next frame, which paces this loop:
+                free = [i for i in range(len(specs)) if i not in busy]
+                images = [p.buffers.frame if p.buffers else None
+                          for p in pipelines]
+                timestamp, frames = group.read(free, images)
+                for i, frame in frames.items():
+                    if not frame_widths[i]:
+                        # The camera didn't tell us its size:
+                        frame_widths[i] = frame.shape[1] / 2
+                    grabbed[i] = timestamp
+                    busy[i] = pool.submit(look, i, frame)
+
+                if not frames and busy:
+                    # A grab that fails comes back at once, so rather than
+                    # trying again right away, give a job a moment to end:
+                    wait(busy.values(), timeout=0.01,
+                         return_when=FIRST_COMPLETED)
+
+                update_fudges(tables, cfg)
+        except EOFError:
+            publish_finished(everything=True)
+            raise
+
+
+# The settings (as keys in our configuration) that the `workers` don't use.
+# Each worker has its own plain pipeline, and frames are recorded (with a
+# `record` section) as the capture thread reads them, like always:
+WORKERS_IGNORE = [("timing", "enabled"), ("reload_interval",),
+                  ("pipeline", "roi"), ("pipeline", "stripes")]
+
+
+# The settings that several `cameras` don't use. Each camera has its own
+# plain pipeline, and is read by us (not a `FrameGrabber`):
+CAMERAS_IGNORE = WORKERS_IGNORE + [("threaded_capture",), ("record", "path")]
+
+
+def warn_ignored(cfg, mode, settings):
+    """
+    Prints a warning naming the `settings` (a list of tuples of keys) that
+    are turned on in our configuration, but that `mode` doesn't use.
+    """
+    ignored = [".".join(keys) for keys in settings
+               if cfg.get_default(*keys, None)]
+    if ignored:
+        print("WARNING: With {}, these settings are ignored: {}".format(
+            mode, ", ".join(ignored)))
+
+
+def run_parallel(frames, publisher, cfg):
+    """
+    Publishes the targets a `parallel.ParallelPipeline` finds, in the order
+    their frames were captured. Raises a `RuntimeError` if a worker dies,
+    or a frame can't be captured.
+    """
+    frames.start()
+    # The frame size is known once the workers have started:
+    frame_width = frames.shape[1] / 2
+    try:
+        for number, target in frames.results():
+            debug_message(2, number, target)
+            publisher.publish(target_values(target, frame_width))
+            update_fudges(tables, cfg)
+    finally:
+        frames.stop()
+
+
+def target_values(target, frame_width, prefix=""):
+    """
+    Returns a dictionary of the values we send to NetworkTables for a
+    target, including any fudge factor offsets. The `prefix` is added to
+    each key, for instance, `yellow/` puts them in the `yellow` subtable.
     """
-    print(target)
     if target == None:
-        tables.send('center_x', 0)
-        tables.send('center_y', 0)
-        tables.send('offset', 0)
+        x, y, offset = 0, 0, 0
     else:
         x = target["center"]["x"] + fudges["center_x"]
         y = target["center"]["y"] + fudges["center_y"]
@@ -103,18 +466,38 @@ def send_target_data(target, frame_width):
             offset = 0
         else:
             offset = frame_width/x
-        tables.send('center_x', x)
-        tables.send('center_y', y)
-        tables.send('offset', offset)
+
+    return {prefix + 'center_x': x,
+            prefix + 'center_y': y,
+            prefix + 'offset': offset}
+
+
+def send_target_data(target, frame_width, prefix=""):
+    """
+    Send the target information over to the NetworkTables (using the `tables`
+    interface) including any fudge factor offsets. This waits for each value
+    to be sent, while a `tables.Publisher` doesn't.
+    """
+    debug_message(2, target)
+    for key, value in target_values(target, frame_width, prefix).items():
+        tables.send(key, value)
 
 
 def update_fudges(tables, cfg):
     """
     Compare the values from the NetworkTables server (which we may change
     during calibration), and if they are different, persist them in our
-    configuration file.
+    configuration file. In write-behind mode, `cfg.save` doesn't wait for
+    the file to be written.
     """
-    global fudges
+    global fudges, seen_fudges
+
+    # When watching the fudges, the same dictionary means nothing changed,
+    # and we don't need to look any further:
+    latest = tables.fudge_values()
+    if latest is not None and latest is seen_fudges:
+        return
+    seen_fudges = latest
 
     x = tables.get_fudge("center_x")
     y = tables.get_fudge("center_y")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+"""
+Times the functions our vision loop spends the most time in, at several
+frame sizes, using the sample images (in `support/samples`) as well as
+synthetic frames with a yellow target in them (see `rand.scene`). For the
+synthetic frames, we also know exactly where the target is, so the
+`single_target` results include how many pixels off its center was.
+
+The results can be saved as JSON, and compared with results saved earlier
+(a _baseline_), to find out if a change made anything slower:
+
+    python benchmark.py --save baseline.json
+    ... change some code ...
+    python benchmark.py --baseline baseline.json
+
+When comparing, this exits with an error if anything got slower by more than
+the `--tolerance` (20% by default), so `make benchmark` can catch it.
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import cv2
+import numpy as np
+from context import lib          # flake8: noqa pylint: disable=unused-import
+from lib import color_mask, math_extras, rand, sources, target_tracker, util
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The (yellow) color range we look for in every frame:
+LOWER = np.array([20, 100, 100])
+UPPER = np.array([40, 255, 255])
+
+RESOLUTIONS = ["320x240", "640x480", "1280x720"]
+
+
+def frames(images, width, height):
+    """
+    Returns a dictionary of named frames, all `width` by `height`, and a
+    dictionary of the ground truth of the synthetic ones.
+    """
+    named, truths = {}, {}
+    for kind in rand.TARGET_SHAPES:
+        name = "synthetic-" + kind
+        named[name], truths[name] = rand.scene(width, height, kind=kind,
+                                               seed=0)
+    for filename in sorted(glob.glob(images)):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        named[name] = cv2.resize(cv2.imread(filename), (width, height),
+                                 interpolation=cv2.INTER_AREA)
+    return named, truths
+
+
+def center_error(mask, truth):
+    "How many pixels the target's center is from the real center."
+    target = target_tracker.single_target(mask)
+    if target is None:
+        return None
+    x, y = truth[0]["center"]
+    return float(np.hypot(target["center"]["x"] - x,
+                          target["center"]["y"] - y))
+
+
+def cases(frame):
+    """
+    Returns a dictionary of the functions to time for a frame. Each stage
+    is given the results of the stage before it, prepared ahead of time, so
+    we only time that one stage.
+    """
+    camera = sources.ArraySource([frame], loop=True)
+    hsv = util.to_hsv(frame)
+    mask = color_mask.get_mask(hsv, LOWER, UPPER)
+    histogram = color_mask.color_histogram(cv2.split(hsv)[0])
+    smoothed = color_mask.smooth(histogram)
+
+    return {
+        "get_hsv": lambda: util.get_hsv(camera, None),
+        "get_mask": lambda: color_mask.get_mask(hsv, LOWER, UPPER),
+        "get_contours": lambda: color_mask.get_contours(mask),
+        "single_target": lambda: target_tracker.single_target(mask),
+        "color_range": lambda: color_mask.color_range(frame),
+        "smooth": lambda: color_mask.smooth(histogram),
+        "top_bell": lambda: math_extras.top_bell(smoothed),
+    }
+
+
+def time_it(func, repeat):
+    """
+    Calls `func` enough times to take at least 0.2 seconds, `repeat` times
+    over, and returns the fastest and the median time of one call, in
+    microseconds.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    rounds = [t / number * 1e6 for t in timer.repeat(repeat, number)]
+    return {"min_us": min(rounds), "median_us": statistics.median(rounds),
+            "number": number}
+
+
+def run(images, resolutions, only, repeat):
+    "Times every case for every frame at every resolution."
+    results = {}
+    for resolution in resolutions:
+        width, height = (int(n) for n in resolution.split("x"))
+        named, truths = frames(images, width, height)
+        for name, frame in named.items():
+            for case, func in cases(frame).items():
+                if only and case not in only:
+                    continue
+                key = "{}/{}/{}".format(case, resolution, name)
+                results[key] = time_it(func, repeat)
+                if case == "single_target" and truths.get(name):
+                    mask = color_mask.get_mask(util.to_hsv(frame),
+                                               LOWER, UPPER)
+                    results[key]["center_error_px"] = center_error(
+                        mask, truths[name])
+                print("{:<48} {:>12.1f} us".format(
+                    key, results[key]["median_us"]))
+    return results
+
+
+def environment():
+    "What we ran on, since results from different computers don't compare."
+    return {"machine": platform.machine(), "node": platform.node(),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "opencv": cv2.__version__}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints how each result compares to the baseline, and returns the keys
+    of the results that got slower by more than the `tolerance`.
+    """
+    slower = []
+    print("\n{:<48} {:>12} {:>12} {:>8}".format(
+        "benchmark", "baseline", "now", "change"))
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before = baseline[key]["median_us"]
+        ratio = result["median_us"] / before
+        flag = ""
+        if ratio > 1 + tolerance:
+            slower.append(key)
+            flag = "  SLOWER"
+        print("{:<48} {:>12.1f} {:>12.1f} {:>+8.1%}{}".format(
+            key, before, result["median_us"], ratio - 1, flag))
+    return slower
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('-i', '--images',
+                        default=os.path.join(HERE, 'samples', '*.jpg'),
+                        help='glob pattern of images to use as frames')
+    PARSER.add_argument('-r', '--resolutions', nargs='+',
+                        default=RESOLUTIONS,
+                        help='frame sizes to run at, like 640x480')
+    PARSER.add_argument('-o', '--only', nargs='+',
+                        help='only run these benchmarks (like get_mask)')
+    PARSER.add_argument('-n', '--repeat', default=5, type=int,
+                        help='number of rounds to time each benchmark')
+    PARSER.add_argument('-s', '--save', help='save the results to this file')
+    PARSER.add_argument('-b', '--baseline',
+                        help='compare with results saved in this file')
+    PARSER.add_argument('-t', '--tolerance', default=0.2, type=float,
+                        help='how much slower (0.2 is 20%%) is too slow')
+    ARGS = PARSER.parse_args()
+
+    RESULTS = run(ARGS.images, ARGS.resolutions, ARGS.only, ARGS.repeat)
+
+    if ARGS.save:
+        with open(ARGS.save, 'w') as outfile:
+            json.dump({"environment": environment(), "results": RESULTS},
+                      outfile, indent=2, sort_keys=True)
+
+    if ARGS.baseline:
+        with open(ARGS.baseline) as infile:
+            BASELINE = json.load(infile)
+        if BASELINE["environment"] != environment():
+            print("\nWARNING: The baseline was made on a different computer "
+                  "(or with different libraries):", BASELINE["environment"])
+        SLOWER = compare(RESULTS, BASELINE["results"], ARGS.tolerance)
+        if SLOWER:
+            print("\n{} benchmarks got slower than the baseline".format(
+                len(SLOWER)))
+            sys.exit(1)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Compares the speed and accuracy of the two ways we can mask a color: converting
+to HSV and calling `inRange` (the `get_mask` function), or looking up each
+pixel's color in a table (the `LookupMask` class).
+"""
+
+import argparse
+import glob
+import time
+import cv2
+import numpy as np
+from context import lib          # flake8: noqa pylint: disable=unused-import
+from lib import color_mask, config, util
+
+
+def time_it(func, repeat):
+    "Returns the average number of microseconds it takes to call `func`."
+    func()  # Warm up (and create any buffers)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(images, lower, upper, width, bits, repeat):
+    """
+    For each image, shrink and blur it (both engines need this), and then
+    time and compare both ways of creating a mask.
+    """
+    lookup_build = time.perf_counter()
+    lookup = color_mask.LookupMask(lower, upper, bits)
+    lookup_build = time.perf_counter() - lookup_build
+    print("Building the {}-bit lookup table took {:.1f} ms\n".format(
+        bits, lookup_build * 1000))
+
+    print("{:<32} {:>10} {:>12} {:>10}".format(
+        "image", "hsv (us)", "lookup (us)", "agreement"))
+    for filename in sorted(glob.glob(images)):
+        img = util.blur(util.shrink(cv2.imread(filename), width))
+        hsv = np.empty_like(img)
+        expected = np.empty(img.shape[:2], np.uint8)
+        mask = np.empty_like(expected)
+
+        def with_hsv():
+            cv2.cvtColor(img, cv2.COLOR_BGR2HSV, dst=hsv)
+            color_mask.get_mask(hsv, lower, upper, expected)
+
+        def with_lookup():
+            lookup.mask(img, mask)
+
+        hsv_time = time_it(with_hsv, repeat)
+        lookup_time = time_it(with_lookup, repeat)
+        agreement = color_mask.mask_agreement(mask, expected)
+
+        print("{:<32} {:>10.1f} {:>12.1f} {:>10.4%}".format(
+            filename[-32:], hsv_time, lookup_time, agreement))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('-i', '--images', default='samples/*.jpg',
+                        help='glob pattern of images to mask')
+    PARSER.add_argument('-c', '--config', default='../tests/test_config.yaml',
+                        help='YAML filename containing the color ranges')
+    PARSER.add_argument('-l', '--color', default='yellow',
+                        help='name of the color range in the config file')
+    PARSER.add_argument('-w', '--width', default=util.FRAME_WIDTH_GOAL,
+                        type=int, help='shrink images to this width first')
+    PARSER.add_argument('-b', '--bits', default=6, type=int,
+                        help='bits of each color channel in the lookup table')
+    PARSER.add_argument('-r', '--repeat', default=200, type=int,
+                        help='number of times to mask each image')
+    ARGS = PARSER.parse_args()
+
+    CFG = config.Config(ARGS.config)
+    LOWER, UPPER = color_mask.unpack_range(CFG.get("color", ARGS.color))
+
+    run(ARGS.images, LOWER, UPPER, ARGS.width, ARGS.bits, ARGS.repeat)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""
+Measures how many frames a second we can look at with a `ParallelPipeline`
+(see `lib/parallel.py`) as we add workers, compared to a plain `Pipeline`
+looking at one frame after another. The frames are synthetic scenes (see
+`rand.scene`), all made before we start timing.
+
+On a computer with four cores, we hope to see the frames per second go up
+until we have three (or four) workers.
+"""
+
+import argparse
+import multiprocessing
+import time
+import numpy as np
+from context import lib          # flake8: noqa pylint: disable=unused-import
+from lib import parallel, rand, sources, target_tracker, util
+from lib.pipeline import Pipeline
+
+LOWER = np.array([20, 100, 100])
+UPPER = np.array([40, 255, 255])
+
+
+def serial_fps(frames, goal):
+    "Frames per second of a single `Pipeline`."
+    pipeline = Pipeline(LOWER, UPPER, goal)
+    camera = sources.ArraySource(frames)
+    started = time.perf_counter()
+    for frame in camera:
+        target_tracker.single_target(pipeline.mask(frame))
+    return len(frames) / (time.perf_counter() - started)
+
+
+def parallel_fps(frames, goal, workers):
+    """
+    Frames per second of a `ParallelPipeline` with `workers` processes.
+    Starting the workers takes a while, so we time from the first result
+    to the last.
+    """
+    camera = sources.ArraySource(frames)
+    pipeline = parallel.ParallelPipeline(camera, LOWER, UPPER, workers,
+                                         goal=goal).start()
+    results = pipeline.results()
+    next(results)
+    started = time.perf_counter()
+    count = sum(1 for _ in results)
+    elapsed = time.perf_counter() - started
+    pipeline.stop()
+    return count / elapsed
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('-f', '--frames', default=300, type=int,
+                        help='number of frames to look at')
+    PARSER.add_argument('-r', '--resolution', default='640x480',
+                        help='size of each frame')
+    PARSER.add_argument('-w', '--workers', default=multiprocessing.cpu_count(),
+                        type=int, help='try up to this many workers')
+    PARSER.add_argument('-g', '--goal', default=util.FRAME_WIDTH_GOAL,
+                        type=int, help='shrink frames to this width first')
+    ARGS = PARSER.parse_args()
+
+    WIDTH, HEIGHT = (int(n) for n in ARGS.resolution.split('x'))
+    FRAMES = [rand.scene(WIDTH, HEIGHT, seed=seed)[0]
+              for seed in range(ARGS.frames)]
+
+    SERIAL = serial_fps(FRAMES, ARGS.goal)
+    print("{:<10} {:>10} {:>10}".format("workers", "fps", "speedup"))
+    print("{:<10} {:>10.1f} {:>10}".format("serial", SERIAL, "1.00x"))
+    for WORKERS in range(1, ARGS.workers + 1):
+        FPS = parallel_fps(FRAMES, ARGS.goal, WORKERS)
+        print("{:<10} {:>10.1f} {:>9.2f}x".format(
+            WORKERS, FPS, FPS / SERIAL))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Measures how fast targets get to NetworkTables: how many frames a second
+we look at and publish, and the _latency_ from capturing a frame to sending
+its target. Nothing is sent over a network. Instead, a `MemoryBackend`
+(see `lib/tables.py`) records when each value arrives.
+
+Each frame's number is published along with its target, so when the
+`frame` key arrives, we know which frame it came from, and when that frame
+was captured. Since the `Publisher` only sends the newest values, some
+frames are never sent when we find targets faster than the publish rate.
+"""
+
+import argparse
+import time
+import numpy as np
+from context import lib          # flake8: noqa pylint: disable=unused-import
+from lib import rand, tables, target_tracker, timing
+from lib.pipeline import Pipeline
+
+LOWER = np.array([20, 100, 100])
+UPPER = np.array([40, 255, 255])
+
+
+def measure(frames, rate):
+    """
+    Looks for the target in every frame, publishing it with a `Publisher`
+    at `rate` times a second. Returns a dictionary of the frames a second,
+    values put a second, how many of the frames were published, and the
+    p50, p95 and p99 latencies (in milliseconds).
+    """
+    backend = tables.MemoryBackend()
+    tables.setup("memory", backend=backend)
+    publisher = tables.Publisher(rate, ready=tables.wait_connected).start()
+    pipeline = Pipeline(LOWER, UPPER)
+
+    captured = []
+    started = time.perf_counter()
+    for number, frame in enumerate(frames):
+        captured.append(time.perf_counter())
+        target = target_tracker.single_target(pipeline.mask(frame))
+        values = {"frame": number}
+        if target:
+            values["center_x"] = target["center"]["x"]
+            values["center_y"] = target["center"]["y"]
+        publisher.publish(values)
+    publisher.stop()
+    elapsed = time.perf_counter() - started
+
+    sent = backend.history("/vision/frame")
+    latencies = [(when - captured[number]) * 1000 for when, number in sent]
+    results = {"fps": len(frames) / elapsed,
+               "puts_per_second": len(backend.puts) / elapsed,
+               "published": len(sent) / len(frames)}
+    for p, ms in zip(timing.PERCENTILES,
+                     np.percentile(latencies, timing.PERCENTILES)):
+        results["latency_p{}_ms".format(p)] = float(ms)
+    return results
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('-f', '--frames', default=300, type=int,
+                        help='number of frames to look at')
+    PARSER.add_argument('-r', '--resolution', default='640x480',
+                        help='size of each frame')
+    PARSER.add_argument('-p', '--rates', nargs='+', type=int,
+                        default=[25, 50, 100, 0],
+                        help='publish rates to try (0 is no limit)')
+    ARGS = PARSER.parse_args()
+
+    WIDTH, HEIGHT = (int(n) for n in ARGS.resolution.split('x'))
+    FRAMES = [rand.scene(WIDTH, HEIGHT, seed=seed)[0]
+              for seed in range(ARGS.frames)]
+
+    print("{:<8} {:>8} {:>8} {:>10} {:>8} {:>8} {:>8}".format(
+        "rate", "fps", "puts/s", "published", "p50 ms", "p95 ms", "p99 ms"))
+    for RATE in ARGS.rates:
+        R = measure(FRAMES, RATE)
+        print("{:<8} {:>8.1f} {:>8.1f} {:>9.1%} {:>8.2f} {:>8.2f} {:>8.2f}"
+              .format(RATE or "none", R["fps"], R["puts_per_second"],
+                      R["published"], R["latency_p50_ms"],
+                      R["latency_p95_ms"], R["latency_p99_ms"]))
@@ -5,28 +5,38 @@
 import argparse
 import cv2
 from context import lib          # flake8: noqa pylint: disable=unused-import
-from lib import color_mask, util, config, target_tracker
+from lib import color_mask, util, config, target_tracker, sources
+from lib.overlay import Overlay
 
-def run(channel, config_file):
+def run(channel, config_file, every=1):
     cfg = config.Config(filename=config_file)
     debug = cfg.get_default("debug", False)
-    cr = cfg.get("color", "yellow")
-    lower, upper = color_mask.unpack_range(cr)
-    camera, width, height = util.get_video(channel)
+    # Look for every color in the configuration file at the same time:
+    multi = color_mask.MultiMask(color_mask.unpack_ranges(cfg.get("color")))
+    camera, width, height = util.get_video(sources.from_config(cfg, channel))
+    # Targets are only drawn (and the windows updated) every few frames:
+    overlay = Overlay(every)
 
     while True:
-        hsv, img = util.get_hsv(camera)
-        masked = color_mask.get_mask(hsv, lower, upper)
-        res = cv2.bitwise_and(hsv, hsv, mask=masked)
+        try:
+            hsv, img = util.get_hsv(camera)
+        except EOFError:
+            break
+        overlay.next_frame()
+        # Every pixel matching any of the colors has a label:
+        labels = multi.labels(hsv)
+        masks = multi.split_labels(labels)
 
         key = cv2.waitKey(1)
 
         if util.has_pressed(key, 'q'):
             break
 
-        print(target_tracker.single_target(masked, img))
-        cv2.imshow("image", img)
-        cv2.imshow("res", res)
+        print(target_tracker.color_targets(masks, overlay=overlay))
+        if overlay.active:
+            res = cv2.bitwise_and(hsv, hsv, mask=labels)
+            cv2.imshow("image", overlay.render(img))
+            cv2.imshow("res", res)
         # cv2.imshow("masked", masked)
 
     cv2.destroyAllWindows()
@@ -38,6 +48,8 @@ if __name__ == '__main__':
                         help ='the USB channel containing camera, 0, 1, or 2')
     PARSER.add_argument('-c', '--config',
                         help ='YAML filename that containing fudge factors and color calibration values')
+    PARSER.add_argument('-e', '--every', default=1, type=int,
+                        help='only draw and display every Nth frame')
 
     ARGS = PARSER.parse_args()
 
@@ -46,7 +58,8 @@ if __name__ == '__main__':
     {0}
 
     It then displays multiple windows of the inside of what the tracking system
-    sees through the USB camera attach to channel, {1}. Also prints the
+    sees through the USB camera attach to channel, {1} (or the frame source
+    given in the configuration file's `source` section). Also prints the
     targeting information to the screen (note, these values will go to
     NetworkTables).
 
@@ -55,4 +68,4 @@ if __name__ == '__main__':
     cancel this application with Control-C.
     """.format(ARGS.config, ARGS.channel))
 
-    run(ARGS.channel, ARGS.config)
+    run(ARGS.channel, ARGS.config, ARGS.every)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+"Test the background frame grabber in the lib/capture file."
+
+from context import lib  # flake8: noqa
+from lib import capture, sources
+from lib.capture import FrameGrabber
+import numpy as np
+import pytest
+import time
+
+
+class FakeCamera:
+    """
+    Pretends to be a `cv2.VideoCapture` where each frame is filled with its
+    frame number, and takes `delay` seconds to read.
+    """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.frames = 0
+        self.released = False
+
+    def read(self, image=None):
+        time.sleep(self.delay)
+        self.frames += 1
+        return True, np.full((4, 4, 3), self.frames % 256, np.uint8)
+
+    def release(self):
+        self.released = True
+
+
+def test_read_returns_newest_frame():
+    "After a while, the grabber should hand us recent frames, not the first."
+    camera = FakeCamera(0.001)
+    grabber = FrameGrabber(camera).start()
+    time.sleep(0.1)
+    success, frame = grabber.read()
+    grabber.release()
+
+    assert success
+    assert frame[0, 0, 0] > 1
+    assert camera.released
+
+
+def test_latest_does_not_wait():
+    "Even with a slow camera, asking for the latest frame returns right away."
+    grabber = FrameGrabber(FakeCamera(0.2)).start()
+    time.sleep(0.3)
+
+    start = time.monotonic()
+    frame, stamp, number = grabber.latest()
+    assert time.monotonic() - start < 0.05
+    assert number == 1
+    assert stamp <= start
+    assert frame is not None
+    grabber.release()
+
+
+def test_read_never_repeats_a_frame():
+    "Reading faster than the camera shouldn't hand out the same frame twice."
+    grabber = FrameGrabber(FakeCamera(0.01)).start()
+    seen = [grabber.read()[1][0, 0, 0] for _ in range(5)]
+    grabber.release()
+
+    assert len(set(seen)) == 5
+
+
+def test_camera_group_decodes_only_wanted():
+    "Every camera is grabbed, but only the wanted ones are retrieved."
+    front = sources.ArraySource([np.full((4, 4, 3), i, np.uint8)
+                                 for i in range(3)])
+    rear = sources.ArraySource([np.full((4, 4, 3), 10 + i, np.uint8)
+                                for i in range(3)])
+    group = capture.CameraGroup([front, rear])
+
+    _, frames = group.read()
+    assert (frames[0] == 0).all() and (frames[1] == 10).all()
+    _, frames = group.read(wanted=[1])
+    assert list(frames) == [1] and (frames[1] == 11).all()
+    assert front.position == 2
+
+    image = np.empty((4, 4, 3), np.uint8)
+    _, frames = group.read(images=[image, None])
+    assert frames[0] is image and (image == 2).all()
+
+    with pytest.raises(EOFError):
+        group.read()
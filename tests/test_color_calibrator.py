@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""Test the functions in the tools/color_calibrator file."""
+
+from context import lib  # flake8: noqa
+from lib.config import Config
+import os
+import sys
+import numpy as np
+
+# The tools are scripts, not a package, so put their folder on the path:
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                '..', 'tools')))
+import color_calibrator  # noqa: E402
+
+
+def test_save_data_sets_color():
+    "Pressing 'g' stores the color range as green in our configuration."
+    cfg = Config(None, {})
+    lower = np.array([40, 100, 100], np.uint8)
+    upper = np.array([80, 255, 255], np.uint8)
+    color_calibrator.save_data(cfg, ord('g'), lower, upper)
+    assert cfg.get("color", "green") == {"lower": [40, 100, 100],
+                                         "upper": [80, 255, 255]}
+
+
+def test_save_data_ignores_other_keys():
+    "Any other key leaves the configuration alone."
+    cfg = Config(None, {})
+    lower = np.array([0, 0, 0], np.uint8)
+    upper = np.array([1, 1, 1], np.uint8)
+    color_calibrator.save_data(cfg, ord('x'), lower, upper)
+    assert cfg.get_default("color", "green", None) is None
+    assert cfg.get_default("color", "yellow", None) is None
@@ -7,6 +7,7 @@ to demonstrate visually how the smooth function can work.
 
 from context import lib  # flake8: noqa
 from lib import color_mask
+import cv2
 import numpy as np
 from numpy.random import randn
 import matplotlib.pyplot as plt
@@ -35,6 +36,83 @@ def test_slope_to_curve():
     assert np.array_equal(y, expected)
 
 
+def test_lookup_mask_matches_get_mask():
+    """
+    The lookup table groups similar colors together, so a few pixels right
+    at the edge of the color range may differ, but nearly all should match.
+    """
+    lower = np.array([20, 70, 160])
+    upper = np.array([40, 170, 212])
+    # Every combination of blue, green and red, in steps of 5:
+    steps = np.arange(0, 256, 5, dtype=np.uint8)
+    b, g, r = np.meshgrid(steps, steps, steps, indexing='ij')
+    img = np.dstack([b.ravel(), g.ravel(), r.ravel()])
+
+    expected = color_mask.get_mask(cv2.cvtColor(img, cv2.COLOR_BGR2HSV),
+                                   lower, upper)
+    mask = color_mask.LookupMask(lower, upper).mask(img)
+
+    assert np.count_nonzero(expected) > 0
+    assert color_mask.mask_agreement(mask, expected) > 0.99
+
+
+def test_multi_mask_matches_get_mask():
+    "Masking several colors at once should give the same masks as get_mask."
+    colors = {
+        'yellow': (np.array([20, 70, 160]), np.array([40, 170, 212])),
+        'green': (np.array([70, 86, 6]), np.array([90, 255, 255])),
+        'dim': (np.array([0, 0, 0]), np.array([179, 255, 90])),
+    }
+    hsv = np.random.randint(0, 256, (40, 60, 3)).astype(np.uint8)
+    masks = color_mask.MultiMask(colors).masks(hsv)
+
+    for name, (lower, upper) in colors.items():
+        assert np.array_equal(masks[name],
+                              color_mask.get_mask(hsv, lower, upper))
+
+
+def speckled_mask():
+    "A mask with one big square and a hundred one-pixel specks."
+    mask = np.zeros((100, 100), np.uint8)
+    mask[::10, ::10] = 255
+    mask[43:58, 23:48] = 255
+    return mask
+
+
+def test_largest_contours():
+    "The largest contours come first, and small ones can be skipped."
+    mask = speckled_mask()
+    contours, areas = color_mask.largest_contours(mask, 2)
+    assert len(contours) == 2
+    assert areas[0] == 14 * 24   # Contours go through the edge pixels
+    assert cv2.contourArea(contours[0]) == areas[0]
+
+    contours, _ = color_mask.largest_contours(mask, 5, min_area=10)
+    assert len(contours) == 1
+
+    assert color_mask.largest_contours(np.zeros_like(mask))[0] == []
+
+
+def test_largest_contours_ties():
+    "Of two shapes of the same size, the same one as get_contours is used."
+    mask = np.zeros((100, 200), np.uint8)
+    mask[10:30, 10:30] = 255
+    mask[60:80, 150:170] = 255
+    mask[50:52, 50:52] = 255
+    expected = color_mask.get_contours(mask)[-1]
+
+    contours, _ = color_mask.largest_contours(mask, 1)
+    assert np.array_equal(contours[0], expected)
+
+
+def test_largest_components():
+    "Components give the same largest shape as the contours do."
+    boxes, areas, centers = color_mask.largest_components(speckled_mask(), 1)
+    assert boxes.tolist() == [[23, 43, 25, 15]]
+    assert areas.tolist() == [25 * 15]
+    assert np.allclose(centers, [[35, 50]])
+
+
 def smooth_demo():
     """
     This demonstration creates a series of numbers along a sine curve, and then
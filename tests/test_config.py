@@ -3,6 +3,7 @@
 
 from context import lib  # flake8: noqa
 from lib.config import Config
+import os
 import tempfile
 import pytest
 
@@ -58,3 +59,112 @@ def test_save_and_load():
     print(c.params)
 
     assert c.params['channel'] == 1
+
+
+def test_save_keeps_permissions():
+    "Saving replaces the file, but keeps its permissions."
+    folder = tempfile.mkdtemp()
+    filename = folder + '/config.yaml'
+    with open(filename, 'w') as outfile:
+        outfile.write("channel: 1\n")
+    os.chmod(filename, 0o644)
+
+    c = Config(filename, {})
+    c.set('channel', 2)
+    c.save()
+    assert os.stat(filename).st_mode & 0o777 == 0o644
+
+
+def test_save_new_file_permissions():
+    "A new file gets the usual permissions (not just the temporary file's)."
+    folder = tempfile.mkdtemp()
+    filename = folder + '/config.yaml'
+    mask = os.umask(0o22)
+    os.umask(mask)
+
+    c = Config(None, {})
+    c.config_file = filename
+    c.set('channel', 2)
+    c.save()
+    assert os.stat(filename).st_mode & 0o777 == 0o666 & ~mask
+
+
+def test_write_behind():
+    "Several quick saves become one write, and closing writes the rest."
+    folder = tempfile.mkdtemp()
+    filename = folder + '/config.yaml'
+    c = Config(filename, {'fudges': {'center_x': 0}}).write_behind(delay=10)
+
+    c.set('fudges', 'center_x', 3)
+    c.save()
+    c.set('fudges', 'center_y', -2)
+    c.save()
+    assert c.dirty
+
+    c.close()
+    assert not c.dirty
+    assert Config(filename, {}).params == {'fudges': {'center_x': 3,
+                                                      'center_y': -2}}
+
+
+def test_reload_if_changed():
+    "Editing the file reloads it, and views of changed sections are rebuilt."
+    folder = tempfile.mkdtemp()
+    filename = folder + '/config.yaml'
+    with open(filename, 'w') as outfile:
+        outfile.write("channel: 1\ncolor: {lower: [1, 2, 3]}\n")
+
+    c = Config(filename, {})
+    built = []
+
+    def build(section):
+        built.append(section)
+        return tuple(section['lower'])
+
+    assert c.view('color', build) == (1, 2, 3)
+    assert c.view('color', build) == (1, 2, 3)
+    assert c.reload_if_changed() == set()
+
+    # Our own saves don't count as changes:
+    c.set('channel', 2)
+    c.save()
+    assert c.reload_if_changed() == set()
+
+    with open(filename, 'w') as outfile:
+        outfile.write("channel: 2\ncolor: {lower: [4, 5, 6]}\n")
+    os.utime(filename, ns=(0, c.mtime + 1))
+
+    assert c.reload_if_changed() == {'color'}
+    assert c.view('color', build) == (4, 5, 6)
+    assert len(built) == 2
+
+
+def test_reload_removes_and_keeps_unsaved():
+    """
+    Reloading removes values that were removed from the file, reports a
+    removed section as changed, and keeps values we set but didn't save.
+    """
+    folder = tempfile.mkdtemp()
+    filename = folder + '/config.yaml'
+    with open(filename, 'w') as outfile:
+        outfile.write("channel: 1\ncolor: {green: 1, yellow: 2}\n"
+                      "fudges: {center_x: 0}\n")
+
+    c = Config(filename, {'debug': 0})
+    c.set('fudges', 'center_x', 5)     # Not saved yet
+
+    with open(filename, 'w') as outfile:
+        outfile.write("color: {green: 1}\nfudges: {center_x: 0}\n")
+    os.utime(filename, ns=(0, c.mtime + 1))
+
+    assert c.reload_if_changed() == {'channel', 'color'}
+    assert c.params == {'debug': 0, 'color': {'green': 1},
+                        'fudges': {'center_x': 5}}
+
+    # Once saved, the file's value is used again:
+    c.save()
+    with open(filename, 'w') as outfile:
+        outfile.write("fudges: {center_x: 7}\n")
+    os.utime(filename, ns=(0, c.mtime + 1))
+    assert c.reload_if_changed() == {'color', 'fudges'}
+    assert c.get('fudges', 'center_x') == 7
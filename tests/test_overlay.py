@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+"Test the deferred drawing in the lib/overlay file."
+
+from context import lib  # flake8: noqa
+from lib.overlay import Overlay
+from lib import target_tracker
+import numpy as np
+
+
+def square_mask():
+    mask = np.zeros((60, 80), np.uint8)
+    mask[20:40, 30:50] = 255
+    return mask
+
+
+def test_tracking_draws_nothing_without_overlay():
+    "Finding a target shouldn't change the mask (or draw anywhere)."
+    mask = square_mask()
+    assert target_tracker.single_target(mask) is not None
+    assert np.array_equal(mask, square_mask())
+
+
+def test_overlay_draws_only_when_rendered():
+    overlay = Overlay()
+    overlay.next_frame()
+    target_tracker.single_target(square_mask(), overlay=overlay)
+    assert len(overlay.commands) > 0
+
+    img = np.zeros((60, 80, 3), np.uint8)
+    overlay.render(img)
+    assert img.any()
+    assert overlay.commands == []
+
+
+def test_overlay_every_nth_frame():
+    "With every=3, only one frame in three records any drawings."
+    overlay = Overlay(every=3)
+    recorded = []
+    for _ in range(6):
+        overlay.next_frame()
+        overlay.circle((10, 10), 3, (0, 0, 255))
+        recorded.append(len(overlay.commands))
+
+    assert recorded == [0, 0, 1, 0, 0, 1]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+"Test the multi-process pipeline in the lib/parallel file."
+
+from context import lib  # flake8: noqa
+from lib import capture, parallel, rand, sources, target_tracker
+from lib.pipeline import Pipeline
+import itertools
+import numpy as np
+import pytest
+
+LOWER = np.array([20, 100, 100])
+UPPER = np.array([40, 255, 255])
+
+
+def test_shared_ring():
+    "Frames written in one ring are seen by another opened by name."
+    ring = parallel.SharedRing(3, (4, 5, 3))
+    other = parallel.SharedRing(3, (4, 5, 3), ring.name)
+    ring.frames[2] = 7
+    assert (other.frames[2] == 7).all()
+    other.close()
+    ring.close()
+    ring.unlink()
+
+
+def test_parallel_matches_serial():
+    "Workers find the same targets as a single pipeline, in frame order."
+    frames = [rand.scene(320, 240, seed=seed)[0] for seed in range(10)]
+    pipeline = parallel.ParallelPipeline(sources.ArraySource(frames),
+                                         LOWER, UPPER, workers=2).start()
+    try:
+        results = list(pipeline.results())
+    finally:
+        pipeline.stop()
+
+    assert [number for number, _ in results] == list(range(10))
+    serial = Pipeline(LOWER, UPPER)
+    for (_, target), frame in zip(results, frames):
+        expected = target_tracker.single_target(serial.mask(frame))
+        assert target == target_tracker.scale_target(expected, serial.scale)
+
+
+def test_parallel_with_frame_grabber():
+    """
+    A `FrameGrabber` hands us its own frames (it ignores the image we give
+    it), which still have to end up in the shared memory for the workers.
+    """
+    frames = [rand.scene(320, 240, seed=seed)[0] for seed in range(3)]
+    camera = capture.FrameGrabber(sources.ArraySource(frames, loop=True))
+    pipeline = parallel.ParallelPipeline(camera.start(), LOWER, UPPER,
+                                         workers=2).start()
+    try:
+        results = list(itertools.islice(pipeline.results(), 12))
+    finally:
+        pipeline.stop()
+        camera.release()
+
+    assert all(target is not None for _, target in results)
+
+
+def broken_finder(mask, orig, min_area):
+    raise ValueError("Broken on purpose")
+
+
+def test_parallel_worker_crash():
+    "If a worker dies, waiting for results raises instead of waiting forever."
+    frames = [rand.scene(320, 240, seed=seed)[0] for seed in range(4)]
+    pipeline = parallel.ParallelPipeline(sources.ArraySource(frames), LOWER,
+                                         UPPER, workers=1,
+                                         finder=broken_finder).start()
+    with pytest.raises(RuntimeError):
+        list(pipeline.results())
+    assert pipeline.ring is None   # Everything was stopped
+
+
+def test_parallel_capture_error():
+    "A frame that can't be read raises, after the frames before it."
+    frames = [rand.scene(320, 240, seed=seed)[0] for seed in range(3)]
+    frames.append(np.zeros((120, 160, 3), np.uint8))   # The wrong size
+    pipeline = parallel.ParallelPipeline(sources.ArraySource(frames), LOWER,
+                                         UPPER, workers=2).start()
+    found = []
+    with pytest.raises(RuntimeError):
+        for number, target in pipeline.results():
+            found.append(number)
+    assert found == [0, 1, 2]
+    assert pipeline.ring is None   # Everything was stopped
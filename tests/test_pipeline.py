@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"Test the frame processing pipeline in the lib/pipeline file."
+
+from context import lib  # flake8: noqa
+from lib.pipeline import Pipeline, ENGINES
+from lib import color_mask, rand, sources, target_tracker, util
+import tracemalloc
+import pytest
+import cv2
+import numpy as np
+
+LOWER = np.array([20, 100, 100])
+UPPER = np.array([40, 255, 255])
+
+
+def yellow_box_frame():
+    "A black 640x480 frame with a yellow box in it."
+    frame = np.zeros((480, 640, 3), np.uint8)
+    cv2.rectangle(frame, (200, 150), (320, 260), (0, 200, 220), -1)
+    return frame
+
+
+def allocated_while(func, frames=20):
+    """
+    Returns the most memory (in bytes) allocated at any one time while
+    calling `func` a number of times.
+    """
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(frames):
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def test_pipeline_matches_get_hsv():
+    "The pipeline should create the same mask as get_hsv and get_mask."
+    source = sources.ArraySource([yellow_box_frame()], loop=True)
+    hsv, _ = util.get_hsv(source)
+    expected = color_mask.get_mask(hsv, LOWER, UPPER)
+
+    pipeline = Pipeline(LOWER, UPPER)
+    mask = pipeline.mask(pipeline.read(source))
+
+    assert np.array_equal(mask, expected)
+    assert pipeline.scale == 640 / 300
+
+
+def test_pipeline_does_not_allocate_frames():
+    """
+    Once the pipeline is running, no new images should be created. Small
+    objects (like the contours and the target dictionary) are fine, so we
+    check that we never allocate anything close to the size of a mask.
+    """
+    source = sources.ArraySource([yellow_box_frame()], loop=True)
+    pipeline = Pipeline(LOWER, UPPER)
+    pipeline.allocate(640, 480)
+
+    def process():
+        mask = pipeline.mask(pipeline.read(source))
+        assert target_tracker.single_target(mask) is not None
+
+    process()   # Warm up
+    limit = pipeline.buffers.mask.nbytes // 4
+    assert allocated_while(process) < limit
+
+    # And just to make sure we can measure it, the old way does allocate:
+    def allocating():
+        hsv, _ = util.get_hsv(source)
+        target_tracker.single_target(color_mask.get_mask(hsv, LOWER, UPPER))
+
+    assert allocated_while(allocating) > limit
+
+
+def test_set_ranges():
+    "Changing the ranges between frames changes the next mask."
+    frame = np.zeros((100, 200, 3), np.uint8)
+    frame[:, :] = (0, 200, 220)  # Yellow
+
+    for engine in ENGINES:
+        if engine == "channel":
+            continue    # Doesn't look at colors, only at one channel
+        pipeline = Pipeline(np.array([20, 100, 100]), np.array([40, 255, 255]),
+                            engine=engine)
+        assert pipeline.mask(frame).all()
+        pipeline.set_ranges(np.array([70, 100, 100]), np.array([90, 255, 255]))
+        assert not pipeline.mask(frame).any()
+
+
+def test_several_colors_need_hsv():
+    "Only the hsv engine can mask several colors at once."
+    colors = {"yellow": (LOWER, UPPER)}
+    for engine in ("lookup", "channel"):
+        with pytest.raises(ValueError):
+            Pipeline(LOWER, UPPER, engine=engine, colors=colors)
+
+
+def test_stripes_match_whole_frame():
+    "Masking a frame in stripes gives exactly the same mask as all at once."
+    frame, _ = rand.scene(640, 480, seed=3)
+    whole = Pipeline(LOWER, UPPER, goal=None)
+    striped = Pipeline(LOWER, UPPER, goal=None, stripes=3)
+
+    assert np.array_equal(whole.mask(frame), striped.mask(frame))
+    assert np.array_equal(whole.buffers.hsv, striped.buffers.hsv)
+
+    small = whole.shrink(frame)
+    assert np.array_equal(whole.mask_window(small, 100, 50, 200, 120),
+                          striped.mask_window(striped.shrink(frame),
+                                              100, 50, 200, 120))
+
+
+def test_channel_engine():
+    """
+    The channel engine keeps pixels that are brighter (in green, minus red)
+    than the threshold, and finds the same target as the hsv engine does.
+    """
+    frame, truth = rand.scene(640, 480, kind="tape", color="green", seed=2)
+    settings = {"channel": "green", "minus": "red", "threshold": 100}
+    pipeline = Pipeline(LOWER, UPPER, goal=None, engine="channel",
+                        channel=settings)
+    mask = pipeline.mask(frame)
+
+    blue, green, red = cv2.split(frame)
+    expected = np.clip(green.astype(int) - red, 0, 255) > 100
+    assert np.array_equal(mask > 0, expected)
+
+    target = target_tracker.single_target(mask)
+    x, y = truth[0]["center"]
+    assert abs(target["center"]["x"] - x) < 2
+    assert abs(target["center"]["y"] - y) < 2
+
+
+def test_channel_mask_blur_and_gray():
+    "A blurred or gray channel mask is the same as doing it by hand."
+    frame, _ = rand.scene(320, 240, seed=4)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    blurred = cv2.blur(gray, (3, 3))
+
+    mask = color_mask.ChannelMask("gray", threshold=90, blur=3).mask(frame)
+    assert np.array_equal(mask > 0, blurred > 90)
+
+
+def test_channel_mask_minus_gray():
+    "Subtracting the brightness really subtracts it."
+    frame, _ = rand.scene(320, 240, kind="tape", color="green", seed=4)
+    green = frame[:, :, 1].astype(int)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    expected = np.clip(green - gray, 0, 255) > 20
+
+    mask = color_mask.ChannelMask("green", minus="gray", threshold=20)
+    assert np.array_equal(mask.mask(frame) > 0, expected)
+
+
+def test_channel_mask_grayscale_frame():
+    "A grayscale frame is masked by its brightness, but has no colors."
+    frame, _ = rand.scene(320, 240, seed=4)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    original = gray.copy()
+
+    mask = color_mask.ChannelMask("gray", threshold=90, blur=3).mask(gray)
+    assert np.array_equal(mask > 0, cv2.blur(gray, (3, 3)) > 90)
+    assert np.array_equal(gray, original)
+
+    with pytest.raises(ValueError):
+        color_mask.ChannelMask("green").mask(gray)
+
+
+def test_window_matches_whole_frame():
+    "Masking a window gives the same mask as that part of the whole frame."
+    frame, _ = rand.scene(640, 480, seed=5, noise=20)
+    for engine in ENGINES:
+        pipeline = Pipeline(LOWER, UPPER, engine=engine)
+        small = pipeline.shrink(frame)
+        whole = pipeline.mask_window(small).copy()
+        window = pipeline.mask_window(small, 100, 50, 120, 80)
+        assert np.array_equal(window, whole[50:130, 100:220])
+
+
+def test_lookup_windows_do_not_allocate():
+    "Masking windows of different sizes re-uses the lookup's images."
+    frame, _ = rand.scene(640, 480, seed=6)
+    pipeline = Pipeline(LOWER, UPPER, engine="lookup")
+    small = pipeline.shrink(frame)
+    pipeline.mask_window(small)     # Warm up
+
+    sizes = iter([(40, 30), (120, 80), (60, 90), (200, 150)] * 5)
+
+    def window():
+        width, height = next(sizes)
+        pipeline.mask_window(small, 20, 10, width, height)
+
+    assert allocated_while(window) < pipeline.buffers.mask.nbytes // 4
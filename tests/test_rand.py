@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+"Test the synthetic frames made by the lib/rand file."
+
+from context import lib  # flake8: noqa
+from lib import rand, target_tracker
+from lib.pipeline import Pipeline
+import numpy as np
+
+LOWER = np.array([20, 100, 100])
+UPPER = np.array([40, 255, 255])
+
+
+def test_scene_is_repeatable():
+    "The same seed always makes the same frame."
+    frame, truth = rand.scene(320, 240, seed=7)
+    again, truth_again = rand.scene(320, 240, seed=7)
+    assert frame.shape == (240, 320, 3)
+    assert np.array_equal(frame, again)
+    assert truth == truth_again
+
+
+def test_scene_ground_truth():
+    "Our pipeline finds each kind of target where the scene says it is."
+    pipeline = Pipeline(LOWER, UPPER, goal=None)
+    for kind in rand.TARGET_SHAPES:
+        for seed in range(3):
+            frame, truth = rand.scene(640, 480, kind=kind, seed=seed)
+            assert len(truth) == 1
+            target = target_tracker.single_target(pipeline.mask(frame))
+            x, y = truth[0]["center"]
+            assert abs(target["center"]["x"] - x) <= 2
+            assert abs(target["center"]["y"] - y) <= 2
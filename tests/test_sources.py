@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+"Test the frame sources in the lib/sources file."
+
+from context import lib  # flake8: noqa
+from lib import recorder, sources, util
+from lib.overlay import Overlay
+from lib.pipeline import Pipeline
+import glob
+import os
+import tempfile
+import cv2
+import numpy as np
+import pytest
+
+SAMPLES = os.path.join(os.path.dirname(__file__), '..', 'support', 'samples',
+                       '*.jpg')
+
+
+def test_image_source_reads_every_sample():
+    "The image source should read each of the sample images once."
+    source = sources.ImageSource(SAMPLES)
+    frames = list(source)
+
+    assert len(frames) == 4
+    assert source.get(cv2.CAP_PROP_FRAME_COUNT) == 4
+    assert not source.isOpened()
+
+
+def test_array_source_loops():
+    "A looping source starts over instead of running out of frames."
+    frames = [np.full((2, 3, 3), n, np.uint8) for n in range(3)]
+    source = sources.ArraySource(frames, loop=True)
+    values = [source.read()[1][0, 0, 0] for _ in range(7)]
+
+    assert values == [0, 1, 2, 0, 1, 2, 0]
+    assert source.get(cv2.CAP_PROP_FRAME_WIDTH) == 3
+    assert source.get(cv2.CAP_PROP_FRAME_HEIGHT) == 2
+
+
+def test_read_into_image():
+    "Reading with an image of the right shape fills that image."
+    source = sources.ArraySource(np.ones((1, 2, 2, 3), np.uint8))
+    image = np.zeros((2, 2, 3), np.uint8)
+    success, frame = source.read(image)
+
+    assert success
+    assert frame is image
+    assert image.sum() == 12
+
+
+def test_open_source_from_spec():
+    source = sources.open_source({'type': 'images', 'path': SAMPLES,
+                                  'preload': True})
+    assert isinstance(source, sources.ImageSource)
+
+    with pytest.raises(ValueError):
+        sources.open_source({'type': 'hologram'})
+
+
+def test_get_hsv_finishes():
+    "Once a replayed source runs out of frames, get_hsv raises an EOFError."
+    source = sources.ArraySource(np.zeros((1, 8, 8, 3), np.uint8))
+    hsv, img = util.get_hsv(source)
+    assert hsv.shape == (8, 8, 3)
+
+    with pytest.raises(EOFError):
+        util.get_hsv(source)
+
+
+def test_record_and_replay_archive():
+    "Recorded frames are replayed, without copies, from the archive."
+    folder = tempfile.mkdtemp()
+    frames = [np.full((24, 32, 3), i, np.uint8) for i in range(5)]
+    archive = recorder.Recorder(folder, 32, 24, capacity=4)
+    camera = recorder.RecordingSource(sources.ArraySource(frames), archive)
+    while camera.read()[0]:
+        pass
+    camera.release()
+    assert camera.position == 5 and archive.count == 4
+
+    source = sources.open_source({"type": "archive", "path": folder})
+    assert source.get(cv2.CAP_PROP_FRAME_COUNT) == 4
+    assert list(source.index["number"]) == [0, 1, 2, 3]
+    assert (np.diff(source.timestamps) >= 0).all()
+
+    for i, frame in enumerate(source):
+        assert (frame == i).all()
+        assert not frame.flags.owndata   # A view of the archive file
+
+
+def test_grab_and_retrieve():
+    "Grabbing skips a frame without decoding it, retrieving decodes it."
+    source = sources.ImageSource(SAMPLES)
+    assert source.grab() and source.grab()
+    success, frame = source.retrieve()
+    assert success
+    assert np.array_equal(frame, cv2.imread(sorted(glob.glob(SAMPLES))[1]))
+
+
+def test_archive_frames_are_not_copied():
+    """
+    Reading an archive through a pipeline hands over the archive's own
+    (read-only) frames, and an overlay copies a frame before drawing on it.
+    The archive is sized from the first frame, and frames of another size
+    are skipped.
+    """
+    folder = tempfile.mkdtemp()
+    archive = recorder.Recorder(folder, capacity=4)
+    assert archive.record(np.full((24, 32, 3), 9, np.uint8))
+    assert not archive.record(np.zeros((48, 64, 3), np.uint8))
+    archive.close()
+    assert archive.count == 1
+
+    source = sources.ArchiveSource(folder)
+    pipeline = Pipeline(np.array([0, 0, 0]), np.array([180, 255, 255]))
+    pipeline.allocate(32, 24)
+    frame = pipeline.read(source)
+    assert frame is not pipeline.buffers.frame
+    assert not frame.flags.writeable
+
+    overlay = Overlay()
+    overlay.circle((10, 10), 3, (0, 0, 255))
+    drawn = overlay.render(pipeline.shrink(frame))
+    assert drawn.flags.writeable and (frame == 9).all()
+
+
+def test_unreadable_image_ends_source():
+    "An image file that can't be read ends the source, like running out."
+    folder = tempfile.mkdtemp()
+    with open(os.path.join(folder, "broken.jpg"), "w") as outfile:
+        outfile.write("not an image")
+    source = sources.ImageSource(os.path.join(folder, "*.jpg"))
+
+    assert source.read(np.empty((4, 4, 3), np.uint8)) == (False, None)
+    assert not source.isOpened()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"Test the NetworkTables helpers in the lib/tables file."
+
+from context import lib  # flake8: noqa
+from lib import tables
+import pytest
+import threading
+import time
+
+
+@pytest.fixture(autouse=True)
+def reset_tables():
+    "Puts the `tables` module back the way it was after each test."
+    yield
+    for name in ('__backend', '__table', '__fudges', '__on_connection'):
+        setattr(tables, name, None)
+    getattr(tables, '__connected').clear()
+
+
+def test_publisher_coalesces_and_skips_unchanged():
+    """
+    Values published faster than the publisher's rate are combined, and only
+    values that changed since they were last sent are sent again.
+    """
+    sent = []
+    publisher = tables.Publisher(rate=1000, send=sent.append)
+
+    publisher.publish({'center_x': 1, 'center_y': 2})
+    publisher.publish({'center_x': 3})
+    publisher.flush()
+    publisher.publish({'center_x': 3, 'center_y': 4})
+    publisher.flush()
+
+    assert sent == [{'center_x': 3, 'center_y': 2}, {'center_y': 4}]
+
+
+def test_publisher_thread():
+    "The background thread sends values, and stopping sends what is left."
+    sent = []
+    publisher = tables.Publisher(rate=100, send=sent.append).start()
+    publisher.publish({'offset': 1})
+    time.sleep(0.05)
+    publisher.publish({'offset': 2})
+    publisher.stop()
+
+    assert sent[0] == {'offset': 1}
+    assert sent[-1] == {'offset': 2}
+
+
+def test_publisher_flush_while_running():
+    """
+    Flushing while the thread is running (with nothing pending) returns
+    right away, and a rate of 0 sends values without any limit.
+    """
+    sent = []
+    publisher = tables.Publisher(rate=0, send=sent.append).start()
+    assert publisher.flush()
+    publisher.publish({'offset': 1})
+    publisher.flush()
+    publisher.stop()
+    assert sent == [{'offset': 1}]
+
+    with pytest.raises(ValueError):
+        tables.Publisher(rate=-1)
+
+
+def test_publisher_survives_errors():
+    "A failed send is printed, but doesn't stop the publisher."
+    def broken(values):
+        raise IOError("no network")
+
+    publisher = tables.Publisher(send=broken)
+    publisher.publish({'offset': 1})
+    publisher.flush()
+    assert publisher.sent == {}
+
+
+def test_publisher_backs_off_without_rate():
+    "Even with no rate limit, a broken network isn't tried over and over."
+    tries = []
+
+    def broken(values):
+        tries.append(values)
+        raise IOError("no network")
+
+    publisher = tables.Publisher(rate=0, send=broken, min_backoff=0.01,
+                                 max_backoff=0.05).start()
+    publisher.publish({'offset': 1})
+    time.sleep(0.2)
+    count = len(tries)
+    publisher.stop()
+    # Waiting 0.01, 0.02, 0.04, then 0.05 seconds between tries:
+    assert 2 <= count <= 10
+
+
+class FakeTable:
+    "Just enough of a NetworkTables table to call our fudge listener."
+    def __init__(self, values):
+        self.values = values
+        self.listener = None
+
+    def getSubTable(self, name):
+        return self
+
+    def addEntryListener(self, listener, immediateNotify=False,
+                         localNotify=False):
+        self.listener = listener
+        if immediateNotify:
+            for key, value in self.values.items():
+                listener(self, key, value, True)
+
+
+def test_watch_fudges():
+    "Fudges pushed by the listener are read without asking NetworkTables."
+    fake = FakeTable({'center_x': 5})
+    setattr(tables, '__table', fake)
+    tables.watch_fudges()
+    assert tables.get_fudge('center_x') == 5
+    assert tables.get_fudge('center_y', 0) == 0
+
+    before = tables.fudge_values()
+    fake.listener(fake, 'center_y', -3, True)
+    assert tables.fudge_values() is not before
+    assert before == {'center_x': 5}
+    assert tables.get_fudge('center_y') == -3
+
+
+def test_publisher_waits_until_ready():
+    "Nothing is sent until we are connected, and then only the newest values."
+    sent = []
+    connected = threading.Event()
+    publisher = tables.Publisher(rate=100, send=sent.append,
+                                 ready=connected.wait,
+                                 max_backoff=0.01).start()
+    publisher.publish({'offset': 1})
+    publisher.publish({'offset': 2})
+    time.sleep(0.05)
+    assert sent == []
+
+    connected.set()
+    publisher.stop()
+    assert sent == [{'offset': 2}]
+
+
+def test_publisher_retries_failed_values():
+    "Values that failed to send are sent once the network works again."
+    sent = []
+    broken = [True]
+
+    def flaky(values):
+        if broken[0]:
+            raise IOError("no network")
+        sent.append(values)
+
+    publisher = tables.Publisher(send=flaky)
+    publisher.publish({'offset': 1, 'size': 5})
+    assert not publisher.flush()
+    publisher.publish({'offset': 2})
+    broken[0] = False
+    assert publisher.flush()
+    assert sent == [{'offset': 2, 'size': 5}]
+
+
+def test_memory_backend():
+    "Everything sent to a MemoryBackend is recorded, with when it was sent."
+    backend = tables.MemoryBackend()
+    tables.setup("nowhere", backend=backend)
+    assert tables.is_connected()
+
+    tables.send_fudge("center_x", 4)
+    tables.watch_fudges()
+    assert tables.get_fudge("center_x") == 4
+
+    # A driver changes a fudge on the dashboard:
+    backend.put("/vision/fudges/center_x", 7, local=False)
+    assert tables.get_fudge("center_x") == 7
+
+    publisher = tables.Publisher(rate=1000, ready=tables.wait_connected)
+    publisher.publish({'center_x': 12})
+    publisher.flush()
+    assert backend.values["/vision/center_x"] == 12
+    assert backend.flushes == 1
+
+    keys = [key for _, key, _ in backend.puts]
+    assert keys == ["/vision/status", "/vision/status",
+                    "/vision/fudges/center_x", "/vision/fudges/center_x",
+                    "/vision/center_x"]
+    times = [when for when, _, _ in backend.puts]
+    assert times == sorted(times)
+
+    backend.disconnect()
+    assert not tables.is_connected()
+
+
+def test_publish_latency():
+    """
+    The memory backend's history tells us how long after a frame was
+    captured its values were published, and the newest frame always is.
+    """
+    backend = tables.MemoryBackend()
+    tables.setup("nowhere", backend=backend)
+    publisher = tables.Publisher(rate=200).start()
+    captured = []
+    for number in range(20):
+        captured.append(time.perf_counter())
+        publisher.publish({'frame': number})
+        time.sleep(0.002)
+    publisher.stop()
+
+    sent = backend.history("/vision/frame")
+    assert sent[-1][1] == 19
+    latencies = [when - captured[number] for when, number in sent]
+    assert all(0 <= latency < 1 for latency in latencies)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"Test the functions in the lib/target_tracker file."
+
+from context import lib  # flake8: noqa
+from lib import color_mask, target_tracker
+from lib.pipeline import Pipeline
+import cv2
+import pytest
+import numpy as np
+
+LOWER = np.array([20, 100, 100])
+UPPER = np.array([40, 255, 255])
+
+
+def box_frame(x, y, width=300, height=200):
+    "A black frame with a 30x20 yellow box at (x, y)."
+    frame = np.zeros((height, width, 3), np.uint8)
+    if x is not None:
+        cv2.rectangle(frame, (x, y), (x + 29, y + 19), (0, 200, 220), -1)
+    return frame
+
+
+def test_single_target_matches_helpers():
+    "single_target should agree with the separate measuring functions."
+    mask = Pipeline(LOWER, UPPER).mask(box_frame(100, 80, 300))
+    contour = color_mask.get_contours(mask)[-1]
+    hull = cv2.convexHull(contour)
+    height, width, orientation = target_tracker.height_width(hull)
+
+    target = target_tracker.single_target(mask.copy())
+    assert target['size'] == target_tracker.target_size(hull)
+    assert (target['center']['x'], target['center']['y']) == \
+        target_tracker.find_contour_center(hull)
+    assert (target['height'], target['width']) == (height, width)
+    assert target['orientation'] == orientation == 'horizontal'
+
+
+def test_extract_all_features():
+    "Measuring contours together gives the same values as one at a time."
+    mask = np.zeros((100, 100), np.uint8)
+    cv2.circle(mask, (30, 30), 12, 255, -1)
+    cv2.rectangle(mask, (60, 50), (90, 60), 255, -1)
+    mask[5, 90] = 255
+    contours = color_mask.get_contours(mask)
+    features = target_tracker.extract_all_features(contours)
+
+    assert len(features) == 3
+    for contour, row in zip(contours, features):
+        f = target_tracker.extract_features(contour)
+        assert np.isclose(row['area'], f.area)
+        assert np.isclose(row['cx'], f.cx) and np.isclose(row['cy'], f.cy)
+        assert (row['x'], row['y'], row['width'], row['height']) == \
+            (f.x, f.y, f.width, f.height)
+        assert np.isclose(row['radius'], f.radius)
+
+    assert len(target_tracker.extract_all_features([])) == 0
+
+
+def test_tracker_follows_target_in_window():
+    "After finding the target once, the tracker only searches near it."
+    pipeline = Pipeline(LOWER, UPPER)
+    tracker = target_tracker.TargetTracker()
+    windows = []
+
+    def mask_window(img, *window):
+        windows.append(window)
+        return pipeline.mask_window(img, *window)
+
+    first = tracker.track(pipeline.shrink(box_frame(100, 80)), mask_window)
+    assert windows[-1] == ()
+    assert tracker.window is not None
+
+    moved = box_frame(106, 83)
+    target = tracker.track(pipeline.shrink(moved), mask_window)
+    assert len(windows[-1]) == 4
+
+    # The target in the window should match searching the whole frame:
+    whole = target_tracker.single_target(pipeline.mask(moved))
+    assert target['center'] == whole['center']
+    assert target['xpos'] == whole['xpos']
+    assert target['center']['x'] > first['center']['x']
+
+
+def test_tracker_searches_everything_after_misses():
+    "Losing the target for a few frames sends us back to the whole frame."
+    pipeline = Pipeline(LOWER, UPPER)
+    tracker = target_tracker.TargetTracker(max_misses=2)
+
+    tracker.track(pipeline.shrink(box_frame(100, 80)), pipeline.mask_window)
+    empty = pipeline.shrink(box_frame(None, None))
+    assert tracker.track(empty, pipeline.mask_window) is None
+    assert tracker.window is not None
+    assert tracker.track(empty, pipeline.mask_window) is None
+    assert tracker.window is None
+
+    # Now the target jumped far away, and we can find it again:
+    far = pipeline.shrink(box_frame(240, 160))
+    assert tracker.track(far, pipeline.mask_window) is not None
+
+
+def test_scale_target():
+    "Scaling a target found in a shrunken frame gives full size values."
+    target = target_tracker.single_target(Pipeline(LOWER, UPPER, goal=None)
+                                          .mask(box_frame(100, 80)))
+    scaled = target_tracker.scale_target(target, 2)
+
+    assert scaled['center']['x'] == target['center']['x'] * 2
+    assert scaled['xpos'][1] == target['xpos'][1] * 2
+    assert target_tracker.scale_target(None, 2) is None
+
+
+def test_get_finder():
+    "Finders are looked up by name, and unknown names are an error."
+    assert target_tracker.get_finder("components") is \
+        target_tracker.component_target
+    with pytest.raises(ValueError):
+        target_tracker.get_finder("blobs")
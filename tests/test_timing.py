@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"Test the stage timers in the lib/timing file."
+
+from context import lib  # flake8: noqa
+from lib import timing
+from lib.pipeline import Pipeline
+import io
+import json
+import numpy as np
+
+
+def test_stage_timer_percentiles():
+    "Only the last `window` times of each stage count towards the report."
+    timer = timing.StageTimer(window=4)
+    for ms in (100, 1, 2, 3, 4):
+        timer.stage("capture", timer.start() - ms * 1000000)
+
+    assert timer.counts["capture"] == 5
+    p50, p95, p99 = timer.percentiles("capture")
+    assert 2.5 <= p50 < 2.6
+    assert 3.9 < p99 < 4.1 and p50 < p95 < p99
+
+    report = timer.report()
+    assert set(report) == {"timing/capture/p50", "timing/capture/p95",
+                           "timing/capture/p99"}
+
+    log = io.StringIO()
+    timer.log(log)
+    line = json.loads(log.getvalue())
+    assert line["counts"] == {"capture": 5}
+    assert line["capture/p50"] == report["timing/capture/p50"]
+
+
+def test_pipeline_stages():
+    "A pipeline with a timer measures each of its stages."
+    timer = timing.StageTimer()
+    pipeline = Pipeline(np.array([20, 100, 100]), np.array([40, 255, 255]),
+                        timer=timer)
+    pipeline.mask(np.zeros((100, 200, 3), np.uint8))
+    assert set(timer.counts) == {"shrink", "hsv", "mask"}
+
+
+def test_timing_off():
+    "The `OFF` timer has nothing to report."
+    t = timing.OFF.start()
+    assert timing.OFF.stage("capture", t) == 0
+    assert timing.OFF.report() == {}
@@ -3,7 +3,9 @@
 
 from context import lib  # flake8: noqa
 from lib import util
+import cv2
 import numpy as np
+import pytest
 import mock
 
 def test_has_pressed_a():
@@ -58,3 +60,46 @@ def test_calibration(mock_loader):
     assert ret_mtx == mtx
     assert ret_dist == dist
     assert ret_newmtx == newcam_mtx
+
+
+def test_shrunk_size():
+    "Frames shrink to the goal width, keeping their shape, but never grow."
+    assert util.shrunk_size(640, 480, 300) == (300, 225)
+    assert util.shrunk_size(200, 100, 300) == (200, 100)
+    assert util.shrunk_size(640, 480, None) == (640, 480)
+
+
+def test_shrink():
+    img = np.zeros((480, 640, 3), np.uint8)
+    assert util.shrink(img, 320).shape == (240, 320, 3)
+    assert util.shrink(img, 1000) is img
+
+
+class FakeSettingsCamera:
+    "A camera that accepts any setting, except frame rates above 30."
+    def __init__(self):
+        self.props = {}
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FPS:
+            value = min(value, 30)
+        self.props[prop] = value
+        return True
+
+    def get(self, prop):
+        return float(self.props.get(prop, 0))
+
+
+def test_configure_camera():
+    "Settings are read back, so we know what the camera really accepted."
+    camera = FakeSettingsCamera()
+    report = util.configure_camera(camera, {"width": 320, "fourcc": "MJPG",
+                                            "fps": 60, "exposure": 10})
+
+    assert report["width"] == (320, 320.0)
+    assert report["fourcc"] == ("MJPG", "MJPG")
+    assert report["fps"] == (60, 30.0)
+    assert report["auto_exposure"] == (1, 1.0)   # Manual, for the exposure
+
+    with pytest.raises(ValueError):
+        util.configure_camera(camera, {"brightness": 5})
@@ -9,6 +9,8 @@ import argparse
 from lib import color_mask
 from lib import util
 from lib import rand
+from lib import config
+from lib import sources
 
 # If true, we can print some extra information (as well save capture images)
 DEBUG = False
@@ -18,12 +20,12 @@ DEBUG = False
 CAPTURE_FILENAME = 'captured-image.jpg'
 
 
-def save_data(key, lower, upper):
+def save_data(cfg, key, lower, upper):
     """
-    Simple wrapper around the color_'s save_mask()
-    function. If DEBUG, this prints extra information.
+    Simple wrapper around the color_mask's pack_range()
+    function, which sets the color in our configuration, `cfg`
+    (if we have one). If DEBUG, this prints extra information.
     """
-    c = Config()
     color_label = False
 
     if util.has_pressed(key, 'y') or util.has_pressed(key, 'c'):
@@ -34,8 +36,11 @@ def save_data(key, lower, upper):
     if color_label:
         if DEBUG:
             print("Saved {} as lower: {}  upper: {}".format(color_label, lower, upper))
-        dc = color_mask.pack(lower, upper)
-        c.set("color", color_label, dc)
+        dc = color_mask.pack_range(lower, upper)
+        if cfg:
+            cfg.set("color", color_label, dc)
+        else:
+            print("{}: {}".format(color_label, dc))
 
 def show_data(image):
     if DEBUG:
@@ -47,14 +52,24 @@ def show_data(image):
             # plt.plot([1, 2, 3, 50, 20])
 
 
-def capture_color_range(channel):
+def capture_color_range(channel, config_file=None):
     """
     Given a USB channel to a camera, wait for the 'c' key is
     pressed, and calculate the most range of the most
     prominent color found (the range makes this easier to
     figure out a mask). The results are stored in `filename`.
+
+    If the configuration file has a `source` section, the images are read
+    from that source instead of the camera. Returns the configuration, with
+    the colors we captured (or None, without a file).
     """
-    camera = cv2.VideoCapture(channel)
+    # Only read the configuration file we are given (never the one in our
+    # home directory), and with no file, use the camera:
+    cfg = config.Config(config_file, defaults={}) if config_file else None
+    if cfg:
+        camera = sources.from_config(cfg, channel)
+    else:
+        camera = sources.CameraSource(channel)
     while True:
         success, image = camera.read()
         if success:
@@ -65,18 +80,21 @@ def capture_color_range(channel):
             break
         elif key > 0 and success:
             lower, upper = color_mask.color_range(image)
-            save_data(key, lower, upper)
+            save_data(cfg, key, lower, upper)
             show_data(image)
 
     # When everything done, release the capture
     camera.release()
     cv2.destroyAllWindows()
+    return cfg
 
 
 if __name__ == '__main__':
     PARSER = argparse.ArgumentParser(description=__doc__)
     PARSER.add_argument('-p', '--channel', default=1, type=int,
                         help='the USB channel containing camera, 0, 1, or 2')
+    PARSER.add_argument('-c', '--config',
+                        help='YAML filename that may contain a frame source')
     PARSER.add_argument('-s', '--savefile',
                         help='the file name to save the color range values')
     PARSER.add_argument('-d', '--debug', action='store_true',
@@ -96,8 +114,10 @@ if __name__ == '__main__':
     Press the 'q' key to quit.
     """.format(ARGS.savefile))
 
-    capture_color_range(ARGS.channel)
+    # Colors are saved in the savefile, along with the rest of the
+    # configuration file we started with (if any):
+    CFG = capture_color_range(ARGS.channel, ARGS.config or ARGS.savefile)
 
-    if ARGS.savefile:
-        from lib import config
-        config.save(ARGS.savefile)
+    if ARGS.savefile and CFG:
+        CFG.config_file = ARGS.savefile
+        CFG.save()